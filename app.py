@@ -1,64 +1,42 @@
 import os
 import re
-import g4f
-import g4f.Provider
+import json
 import time
-import random
-import aiohttp
-from aiohttp import ClientResponseError
+import uuid
 from datetime import timedelta
-from flask import Flask, render_template, redirect, url_for, request, session
+from flask import Flask, render_template, redirect, url_for, request, session, jsonify, Response, send_file
 from markupsafe import Markup
+from jobs import JobQueue
+from grade_results import EssayResult, BatchEntry
+from batch import (
+    read_essays, grade_batch, write_gradebook, parse_rubric_text, rubric_to_text, checkpoint_store, is_failed
+)
+from image_prep import OCR_MAX_SIDE, OCR_JPEG_QUALITY
+from engine import (
+    CACHE_DIR, response_cache, ocr_cache, parse_stats, rate_limiter, retry_policy, text_router, text_hedger, ocr_router,
+    cached_image_text, pages_to_text, evaluate_essay
+)
 
 app = Flask(__name__, template_folder="templates")
 app.secret_key = os.urandom(24)
 app.config['SESSION_TYPE'] = 'filesystem'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)
 
-client = g4f.Client(provider=g4f.Provider.GeminiPro, api_key="Put Your API Key Here")
-image_to_text_client = g4f.Client(provider=g4f.Provider.GeminiPro, api_key="Put Your API Key Here") 
+# A job event stream only sends what is new and ends, and the browser asks again after
+# SSE_POLL_MS, so open results pages don't tie up the web process's few threads
+SSE_POLL_MS = int(os.environ.get("SSE_POLL_MS", 1000))
 
-def image_to_text(image_file):
-    try:
-        print("\n===== Image Processing Start =====")
-        print(f"Received image: {image_file.filename}")
-
-        images = [[image_file, image_file.filename]]
-
-        print("Sending image to AI for text extraction...")
-        response = image_to_text_client.chat.completions.create(
-            messages=[{
-                "content": (
-                    "Extract only the plain text from this image. "
-                    "Do not use any special symbols like # or *. "
-                    "If there are crossed-out words, ignore them as they are erasures. "
-                    "Only include the readable text without any formatting."
-                ),
-                "role": "user"
-            }],
-            model="",
-            images=images
-        )
-
-        if hasattr(response, 'choices') and len(response.choices) > 0:
-            raw_content = response.choices[0].message.content
-            sanitized_content = raw_content.replace("#", "").replace("*", "").strip()
-
-            print("\n===== AI Response =====")
-            print(f"Raw extracted content: {raw_content}")
-            print(f"Sanitized content: {sanitized_content}")
-            print("=========================\n")
-
-            return sanitized_content if sanitized_content else "No text could be extracted."
-        
-        print("No text extracted from the image.")
-        return "No text could be extracted."
+# Batch uploads wait here for the worker. A batch that finished with failed essays keeps its
+# upload and checkpoints for a retry, until BATCH_RETRY_TTL seconds after it was last run
+UPLOAD_DIR = os.path.join(CACHE_DIR, 'uploads')
+BATCH_RETRY_TTL = float(os.environ.get("BATCH_RETRY_TTL", 7 * 24 * 3600))
 
-    except Exception as e:
-        print("\n===== Error Occurred =====")
-        print(f"Error during image processing: {e}")
-        print("=========================\n")
-        return f"An error occurred during image processing: {str(e)}"
+# Grading runs as a background job so the request returns immediately (see worker.py)
+job_queue = JobQueue(
+    os.path.join(CACHE_DIR, "jobs.sqlite3"),
+    lease_seconds=float(os.environ.get("JOB_LEASE_SECONDS", 300)),
+    max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+)
 
 def format_justification(justification):
     justification = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', justification)  # Bold text
@@ -67,112 +45,115 @@ def format_justification(justification):
     
     return Markup(justification)  # Use Markup to render HTML safely
 
-def generate_summary(text):
-    if len(text.split()) < 20:
-        return "Error: The text inputted must not have lesser than 20 words."
-    try:
-        response = client.chat.completions.create(
-            model="gemini-2.5-flash",
-            messages=[{"role": "user", "content": f"Summarize this text:\n\n{text}"}]
-        )
-        if not response.choices:
-            return "No summary could be generated."
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"An error occurred during summarization: {str(e)}"
-    
-def retry_request(func, max_retries=3):
-    """Retries an API request with exponential backoff in case of 429 Too Many Requests."""
-    for i in range(max_retries):
+def expire_batch_uploads():
+    """Deletes the uploads and checkpoints of batches that were kept for a retry longer than BATCH_RETRY_TTL."""
+    if not os.path.isdir(UPLOAD_DIR):
+        return
+    cutoff = time.time() - BATCH_RETRY_TTL
+    for filename in os.listdir(UPLOAD_DIR):
+        path = os.path.join(UPLOAD_DIR, filename)
         try:
-            return func()
-        except ClientResponseError as e:  # Directly use the imported exception
-            if e.status == 429:  # Handle rate limit
-                wait_time = (2 ** i) + random.uniform(0, 1)  # Exponential backoff
-                print(f"Rate limit hit, retrying in {wait_time:.2f} seconds...")
-                time.sleep(wait_time)
-            else:
-                raise e  # Raise error if it's not a 429
-    raise Exception("Max retries reached")
-
-def grade_essay(essay_text, context_text):
-    """Grades an essay using AI with retry handling for rate limits."""
-    if len(essay_text.split()) < 20:
-        return "Error: Ang input na teksto ay dapat magkaroon ng hindi bababa sa 20 salita."
-
-    criteria = session.get('criteria', [])
-    if not criteria:
-        return "No criteria set for grading."
-    
-    total_points_possible = session.get('total_points_possible', 0)
-    if total_points_possible == 0:
-        return "No valid criteria to grade the essay."
-    
-    total_points_received = 0
-    grades_per_criterion = []
-    
-    grade_pattern = re.compile(r"Grade:\s*(\d+(\.\d+)?)\/(\d+)")
-    justification_pattern = re.compile(r"Justification:\s*(.*)", re.DOTALL)
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            os.remove(path)
+        except OSError:  # Another worker removed it first
+            continue
+        checkpoint_store.clear(os.path.splitext(filename)[0])
+        print(f"Batch {os.path.splitext(filename)[0]} was not retried in time, removed its upload and checkpoints")
+
+def process_essay_job(payload, report):
+    """Job handler: summarizes and grades one essay and saves the downloadable results file.
+
+    When the payload has a previous_result, its summary and graded criteria are
+    kept and only the criteria that failed are graded again.
+    """
+    def report_html(event, data):
+        if event == 'criterion':
+            data = dict(data, justification=format_justification(data['justification']))
+        report(event, data)
+
+    completed, summary = None, None
+    if payload.get('previous_result'):
+        previous = EssayResult.from_dict(payload['previous_result'])
+        completed = {
+            index: (criterion.points_received, criterion.justification)
+            for index, criterion in enumerate(previous.grade.criteria) if not criterion.error
+        }
+        if not previous.summary.startswith("An error occurred"):
+            summary = previous.summary
 
-    for criterion in criteria:
-        truncated_essay = essay_text[:1000]  # Limiting to 1000 characters
+    result = evaluate_essay(payload['original_text'], payload['context_text'], payload['criteria'], report_html,
+                            completed_criteria=completed, summary=summary)
 
-        # Debugging: Log what is being sent to the AI
-        print("\n===== Sending to AI =====")
-        print(f"Criterion: {criterion['name']}")
-        print(f"Points Possible: {criterion['points_possible']}")
-        print(f"Essay (first 1000 chars): {truncated_essay}")
-        print(f"Context: {context_text}")
-        print("=========================\n")
+    results_dir = os.path.join(app.root_path, 'static', 'results')
+    os.makedirs(results_dir, exist_ok=True)
 
-        try:
-            response = retry_request(lambda: client.chat.completions.create(
-                model="gemini-2.5-flash",
-                messages=[{
-                    "role": "user",
-                    "content": (
-                        f"Grade the following student work based on the criterion '{criterion['name']}' out of {criterion['points_possible']} points.\n\n"
-                        f"Context from teacher: {context_text}\n\n"
-                        "When grading, consider:\n"
-                        f"1. How well the student addresses the specific requirements of '{criterion['name']}'\n"
-                        "2. Both the strengths and areas for improvement in the student's work\n"
-                        "3. The depth of understanding demonstrated, not just surface-level content\n"
-                        "4. The appropriate use of concepts and terminology related to the topic\n\n"
-                        "be fair with the assessment. Only assign a failing grade if the student work shows no clear connection to the required topic or criterion.\n\n"
-                        f"Essay to grade: {truncated_essay}\n\n"
-                        "Your response should follow this format:\n"
-                        f"Grade: [numeric value]/{criterion['points_possible']}\n"
-                        "Justification: [ 3-sentence detailed justification including examples]"
-                    )
-                }]
-            ))
-
-            raw_grade = response.choices[0].message.content.strip()
-
-            # Debugging: Log AI Response
-            print("\n===== AI Response =====")
-            print(raw_grade)
-            print("=======================\n")
-
-            grade_match = grade_pattern.search(raw_grade)
-            points_received = float(grade_match.group(1)) if grade_match else 0
-
-            justification_match = justification_pattern.search(raw_grade)
-            justification = justification_match.group(1) if justification_match else "No justification provided."
-
-            total_points_received += points_received
-            grades_per_criterion.append(
-                f"Criterion: {criterion['name']} - Grade: {points_received}/{criterion['points_possible']} - Justification: {justification}"
-            )
+    results_filename = os.path.join(results_dir, f"{payload['student_name']}_results.txt")
+    with open(results_filename, 'w', encoding='utf-8') as f:
+        f.write(f"Student Name: {payload['student_name']}\n\n")
+        f.write(f"Original Essay:\n{payload['original_text']}\n\n")
+        f.write(f"Summary:\n{result.summary}\n\n")
+        f.write(f"Grade:\n{result.grade.to_text()}\n")
+
+    return result.to_dict()
+
+def grade_batch_job(payload, report):
+    """Job handler: grades every essay of a batch upload and writes the gradebook.
+
+    Progress is checkpointed under the batch id, so a retried or resumed job
+    only grades what the earlier attempts didn't finish. When some essays fail,
+    the upload and checkpoints are kept so they can be retried on their own.
+    """
+    expire_batch_uploads()
+    with open(payload['upload_path'], 'rb') as f:
+        essays = read_essays(f.read(), payload['upload_name'])
+
+    entries, stage_stats = grade_batch(essays, payload['context_text'], payload['criteria'], report,
+                                       checkpoint_key=payload['batch_id'])
+    gradebook_path = write_gradebook(
+        entries, payload['criteria'], os.path.join(CACHE_DIR, 'gradebooks', f"{payload['batch_id']}.xlsx")
+    )
+    if any(is_failed(entry) for entry in entries):
+        print(f"Batch {payload['batch_id']} finished with failed essays, keeping it for a retry")
+    else:
+        os.remove(payload['upload_path'])
+        checkpoint_store.clear(payload['batch_id'])
+
+    return {'entries': [entry.to_dict() for entry in entries], 'gradebook': gradebook_path,
+            'stage_stats': stage_stats}
+
+JOB_HANDLERS = {'process_essay': process_essay_job, 'grade_batch': grade_batch_job}
+
+def render_results(student_name, original_text, context_text, result, retry_url=None):
+    """Renders results.html from an EssayResult.
+
+    retry_url is where the "Retry failed criteria" button posts to, shown when some criteria failed.
+    """
+    criteria_results = [
+        {
+            'name': criterion.name,
+            'grade': criterion.grade,
+            'justification': format_justification(criterion.error or criterion.justification),
+            'failed': bool(criterion.error)
+        }
+        for criterion in result.grade.criteria
+    ]
 
-        except Exception as e:
-            print(f"Error during AI grading: {e}")
-            return f"An error occurred while grading: {str(e)}"
+    return render_template('results.html',
+                         essay=original_text,
+                         summary=result.summary,
+                         final_grade=result.grade.final_grade,
+                         grade=result.grade.final_grade or "N/A",
+                         criteria_results=criteria_results,
+                         context=context_text,
+                         student_name=student_name,
+                         retry_url=retry_url if result.grade.failed_criteria else None)
 
-    final_grade = f"{total_points_received}/{total_points_possible}"
-    result_summary = "\n".join(grades_per_criterion)
+@app.context_processor
+def inject_upload_settings():
+    """Size and quality the scan form shrinks images to before uploading, matching what OCR uses."""
+    return {'upload_settings': {'max_side': OCR_MAX_SIDE, 'quality': OCR_JPEG_QUALITY / 100}}
 
-    return f"Final Grade: {final_grade}\n\n{result_summary}"
 @app.route('/')
 def home():
     return redirect(url_for('front_page'))
@@ -181,6 +162,23 @@ def home():
 def front_page():
     return render_template('front_page.html')
 
+def read_scan_pages(images, page_order):
+    """Returns the pages uploaded on the scan form in the teacher's order.
+
+    page_order is a comma-separated list with, per page, the index of its upload or,
+    for a page the browser didn't upload because /ocr_cache already had it, its SHA-256.
+    Without it, the uploads are taken in the order they were sent.
+    """
+    uploads = [(image.read(), image.filename) for image in images if image]
+    pages = []
+    for item in page_order.split(','):
+        item = item.strip()
+        if re.fullmatch(r'[0-9a-fA-F]{64}', item):
+            pages.append(item.lower())
+        elif item.isdigit() and int(item) < len(uploads):
+            pages.append(uploads[int(item)])
+    return pages or uploads
+
 @app.route('/scan', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
@@ -193,11 +191,11 @@ def index():
         session['context_text'] = context
         
         # Handling the image or essay input as before...
-        image = request.files.get('image')
-        if image:
-            essay = image_to_text(image)
-            if "Error" in essay:
-                return render_template('index.html', error=essay, context=context)
+        pages = read_scan_pages(request.files.getlist('image'), request.form.get('page_order', ''))
+        if pages:
+            essay, error = pages_to_text(pages)
+            if error:
+                return render_template('index.html', error=error, context=context)
         else:
             essay = request.form.get('essay', '')
 
@@ -216,6 +214,13 @@ def index():
     print(f"Retrieved context from session: {context}")  # Debug print
     return render_template('index.html', context=context)
 
+@app.route('/ocr_cache/<image_sha256>', methods=['GET'])
+def ocr_cache_lookup(image_sha256):
+    """Tells the scan form whether an image with this SHA-256 was already read, so it can skip the upload."""
+    if not re.fullmatch(r'[0-9a-fA-F]{64}', image_sha256):
+        return jsonify({'error': "Not a SHA-256 hash."}), 400
+    return jsonify({'cached': cached_image_text(image_sha256, count=False) is not None})
+
 @app.route('/set_criteria', methods=['GET', 'POST'])
 def set_criteria():
     # Get context from session
@@ -259,7 +264,7 @@ def set_criteria():
 
 @app.route('/process_essay', methods=['POST'])
 def process_essay():
-    """Handles essay grading and result processing."""
+    """Queues the essay for grading and sends the browser to its results page."""
     student_name = session.get('student_name', 'Unnamed Student')
     original_text = session.get('original_text', '')
     context_text = session.get('context_text', '')
@@ -267,49 +272,89 @@ def process_essay():
     if not original_text or not context_text:
         return redirect(url_for('index'))
 
-    summary_result = generate_summary(original_text)
-    grade_result = grade_essay(original_text, context_text)
-
-    grade_lines = grade_result.split('\n')
-    final_grade = grade_lines[0] if grade_lines else 'N/A'
-    
-    criteria_results = []
-
-    for line in grade_lines[2:]:  
-        if line.strip():
-            if line.startswith('Criterion:'):
-                parts = line.split(' - ')
-                if len(parts) >= 3:
-                    criterion_name = parts[0].replace('Criterion:', '').strip()
-                    grade = parts[1].replace('Grade:', '').strip()
-                    justification = parts[2].replace('Justification:', '').strip()
-                    
-                    justification = format_justification(justification)  
-
-                    criteria_results.append({
-                        'name': criterion_name,
-                        'grade': grade,
-                        'justification': justification  
-                    })
-
-    results_dir = os.path.join(app.root_path, 'static', 'results')
-    os.makedirs(results_dir, exist_ok=True)
+    job_id = job_queue.enqueue('process_essay', {
+        'student_name': student_name,
+        'original_text': original_text,
+        'context_text': context_text,
+        'criteria': session.get('criteria', [])
+    })
+    print(f"Queued grading job {job_id} for {student_name}")
+
+    return redirect(url_for('job_results', job_id=job_id))
+
+@app.route('/results/<job_id>', methods=['GET'])
+def job_results(job_id):
+    """Shows the results of a grading job, or a waiting page that polls until the job is done."""
+    job = job_queue.get(job_id)
+    if job is None or job['kind'] != 'process_essay':
+        return redirect(url_for('index'))
 
-    results_filename = os.path.join(results_dir, f"{student_name}_results.txt")
-    with open(results_filename, 'w', encoding='utf-8') as f:
-        f.write(f"Student Name: {student_name}\n\n")
-        f.write(f"Original Essay:\n{original_text}\n\n")
-        f.write(f"Summary:\n{summary_result}\n\n")
-        f.write(f"Grade:\n{grade_result}\n")
+    payload = job['payload']
+    if job['status'] == 'done':
+        return render_results(payload['student_name'], payload['original_text'], payload['context_text'],
+                              EssayResult.from_dict(job['result']),
+                              retry_url=url_for('retry_failed_criteria', job_id=job_id))
+    if job['status'] == 'failed':
+        return render_template('job_status.html', job=job)
 
+    # Still running: render the page skeleton at once and let /jobs/<job_id>/events fill it in
     return render_template('results.html',
-                         essay=original_text,
-                         summary=summary_result,
-                         final_grade=final_grade,
-                         grade=final_grade or "N/A",
-                         criteria_results=criteria_results,
-                         context=context_text,
-                         student_name=student_name)
+                         essay=payload['original_text'],
+                         summary=None,
+                         grade=None,
+                         criteria_results=[{'name': criterion['name']} for criterion in payload['criteria']],
+                         context=payload['context_text'],
+                         student_name=payload['student_name'],
+                         job_id=job_id)
+
+@app.route('/results/<job_id>/retry', methods=['POST'])
+def retry_failed_criteria(job_id):
+    """Queues a new job that grades only the criteria that failed, keeping everything else."""
+    job = job_queue.get(job_id)
+    if job is None or job['kind'] != 'process_essay' or job['status'] != 'done':
+        return redirect(url_for('job_results', job_id=job_id))
+
+    new_job_id = job_queue.enqueue('process_essay', dict(job['payload'], previous_result=job['result']))
+    print(f"Queued job {new_job_id} to retry the failed criteria of {job_id}")
+    return redirect(url_for('job_results', job_id=new_job_id))
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify({
+        'id': job['id'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'progress': job['progress'],
+        'error': job['error'],
+        'result': job['result']  # EssayResult.to_dict() once the job is done
+    })
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events of a job's summary and per-criterion grades as they are ready.
+
+    Each response only carries the events after the Last-Event-ID the browser
+    sends back and then ends. EventSource reconnects by itself after the
+    retry interval, so the page is polling, and no web thread waits on a job.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    last_seq = int(last_event_id) if last_event_id.isdigit() else 0
+
+    chunks = [f"retry: {SSE_POLL_MS}\n\n"]
+    if job['status'] in ('done', 'failed'):
+        # The page reloads with the full result, so events it hasn't seen don't matter
+        chunks.append(f"event: {job['status']}\ndata: {json.dumps({'error': job['error']})}\n\n")
+    else:
+        for seq, event, data in job_queue.events_since(job_id, last_seq):
+            chunks.append(f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n")
+
+    return Response("".join(chunks), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/clear_session', methods=['POST'])
 def clear_session():
@@ -321,6 +366,123 @@ def clear_session():
 def contact():
     return redirect("https://www.facebook.com/profile.php?id=61567870400304")
 
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({**response_cache.stats(), 'ocr': ocr_cache.stats()})
+
+@app.route('/rate_limit_stats', methods=['GET'])
+def rate_limit_stats():
+    return jsonify({
+        'buckets': rate_limiter.stats(),
+        'retry_budget': retry_policy.budget.stats()
+    })
+
+@app.route('/provider_stats', methods=['GET'])
+def provider_stats():
+    return jsonify({
+        'text': text_router.stats(),
+        'hedging': text_hedger.stats(),
+        'ocr': ocr_router.stats(),
+        'grade_format': parse_stats.stats()
+    })
+
+@app.route('/batch', methods=['GET', 'POST'])
+def batch_upload():
+    """Grades a whole class set, uploaded as a zip of images or a CSV/XLSX of essays."""
+    if request.method == 'POST':
+        upload = request.files.get('essays')
+        context = request.form.get('context', '').strip()
+        rubric = request.form.get('rubric', '')
+
+        def form_error(message):
+            return render_template('batch.html', error=message, context=context, rubric=rubric)
+
+        if not upload or not upload.filename:
+            return form_error("Error: Please choose a file with the essays.")
+        if not context:
+            return form_error("Error: Please provide context for grading.")
+        try:
+            criteria = parse_rubric_text(rubric)
+            if not criteria:
+                return form_error("Error: Please enter at least one rubric criterion.")
+            data = upload.read()
+            essays = read_essays(data, upload.filename)
+        except Exception as e:
+            return form_error(f"Error: {str(e)}")
+
+        # The worker reads the upload from disk, so the job payload stays small
+        batch_id = uuid.uuid4().hex
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        upload_path = os.path.join(UPLOAD_DIR, batch_id + os.path.splitext(upload.filename)[1].lower())
+        with open(upload_path, 'wb') as f:
+            f.write(data)
+
+        job_id = job_queue.enqueue('grade_batch', {
+            'batch_id': batch_id,
+            'upload_path': upload_path,
+            'upload_name': upload.filename,
+            'student_names': [essay['student_name'] for essay in essays],
+            'context_text': context,
+            'criteria': criteria
+        })
+        print(f"Queued batch job {job_id} with {len(essays)} essays")
+        return redirect(url_for('batch_results', job_id=job_id))
+
+    return render_template('batch.html',
+                         context=session.get('context_text', ''),
+                         rubric=rubric_to_text(session.get('criteria', [])))
+
+@app.route('/batch/<job_id>', methods=['GET'])
+def batch_results(job_id):
+    """Shows the progress of a batch job and, once it is done, every grade and the gradebook link."""
+    job = job_queue.get(job_id)
+    if job is None or job['kind'] != 'grade_batch':
+        return redirect(url_for('batch_upload'))
+    if job['status'] == 'failed':
+        return render_template('job_status.html', job=job, retry_url=url_for('batch_upload'),
+                               resume_url=url_for('resume_batch', job_id=job_id))
+
+    payload = job['payload']
+    entries = stage_stats = retry_url = None
+    if job['status'] == 'done':
+        entries = [BatchEntry.from_dict(entry) for entry in job['result']['entries']]
+        stage_stats = job['result'].get('stage_stats')
+        if any(is_failed(entry) for entry in entries) and os.path.exists(payload['upload_path']):
+            retry_url = url_for('resume_batch', job_id=job_id)
+    return render_template('batch_results.html',
+                         job_id=job_id,
+                         status=job['status'],
+                         progress=job['progress'],
+                         student_names=payload['student_names'],
+                         entries=entries,
+                         stage_stats=stage_stats,
+                         retry_url=retry_url)
+
+@app.route('/batch/<job_id>/resume', methods=['POST'])
+def resume_batch(job_id):
+    """Runs a failed batch job, or the failed essays of a finished one, again.
+
+    Every essay and criterion it already graded is kept.
+    """
+    job = job_queue.get(job_id)
+    # A finished batch keeps its upload only when some of its essays failed
+    if job is None or job['kind'] != 'grade_batch':
+        return redirect(url_for('batch_results', job_id=job_id))
+    try:
+        os.utime(job['payload']['upload_path'])  # Kept for another BATCH_RETRY_TTL from now
+    except OSError:  # Expired, or the batch had nothing to retry
+        return redirect(url_for('batch_results', job_id=job_id))
+    if job_queue.retry(job_id, statuses=('failed', 'done')):
+        print(f"Resuming batch job {job_id}")
+    return redirect(url_for('batch_results', job_id=job_id))
+
+@app.route('/batch/<job_id>/gradebook', methods=['GET'])
+def batch_gradebook(job_id):
+    job = job_queue.get(job_id)
+    if job is None or job['kind'] != 'grade_batch' or job['status'] != 'done':
+        return redirect(url_for('batch_results', job_id=job_id))
+    return send_file(job['result']['gradebook'], as_attachment=True, download_name="gradebook.xlsx")
+
 @app.route('/how-to-use', methods=['GET'])
 def how_to_use():
     return render_template('how_to_use.html')
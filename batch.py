@@ -0,0 +1,303 @@
+"""Batch grading of a whole class set with one rubric and context.
+
+Essays come from a zip of scanned images or a CSV/XLSX of student names and
+essay text. They go through a two-stage pipeline, reading (OCR for images)
+and grading, so later scans are read while earlier essays are graded. The
+results are written to an XLSX gradebook.
+"""
+import io
+import os
+import csv
+import zipfile
+import threading
+
+from engine import CACHE_DIR, image_to_text, is_ocr_error, evaluate_essay
+from grade_results import BatchEntry
+from pipeline import Pipeline, Stage
+from checkpoints import CheckpointStore
+
+# Workers per pipeline stage. A grading worker already sends all of an essay's criteria
+# at once, so it needs fewer workers than OCR for the same provider load.
+BATCH_OCR_WORKERS = max(1, int(os.environ.get("BATCH_OCR_WORKERS", 4)))
+BATCH_GRADE_WORKERS = max(1, int(os.environ.get("BATCH_GRADE_WORKERS", 2)))
+
+# Essays that may wait between stages; a full queue holds the earlier stage back
+BATCH_QUEUE_SIZE = max(1, int(os.environ.get("BATCH_QUEUE_SIZE", 4)))
+
+# Refuse zips that would unpack to more than this many bytes
+BATCH_MAX_UNCOMPRESSED = int(os.environ.get("BATCH_MAX_UNCOMPRESSED", 200 * 1024 * 1024))
+
+# Finished OCR text, criterion grades and essays of running batches, so a restarted batch resumes
+checkpoint_store = CheckpointStore(os.path.join(CACHE_DIR, "checkpoints.sqlite3"))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+NAME_COLUMNS = ('student_name', 'student', 'name')
+ESSAY_COLUMNS = ('essay', 'essay_text', 'text', 'response')
+
+
+def parse_rubric_text(text):
+    """Parses one criterion per line, written as "Name | points | detailed breakdown".
+
+    The breakdown is optional. Raises ValueError on a line without valid points.
+    """
+    criteria = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        parts = [part.strip() for part in line.split('|', 2)]
+        if len(parts) < 2 or not parts[0]:
+            raise ValueError(f"Rubric line {line_number} should look like 'Name | points | breakdown'.")
+        try:
+            points_possible = float(parts[1])
+        except ValueError:
+            raise ValueError(f"Rubric line {line_number}: '{parts[1]}' is not a number of points.")
+        if points_possible <= 0:
+            raise ValueError(f"Rubric line {line_number}: points must be more than 0.")
+        criteria.append({
+            'name': parts[0],
+            'points_possible': points_possible,
+            'detailed_breakdown': parts[2] if len(parts) > 2 else ""
+        })
+
+    total_points_possible = sum(criterion['points_possible'] for criterion in criteria)
+    for criterion in criteria:
+        criterion['weight'] = criterion['points_possible'] / total_points_possible
+    return criteria
+
+
+def rubric_to_text(criteria):
+    """Inverse of parse_rubric_text, used to prefill the batch form."""
+    return "\n".join(
+        f"{criterion['name']} | {criterion['points_possible']:g}"
+        + (f" | {criterion['detailed_breakdown']}" if criterion.get('detailed_breakdown') else "")
+        for criterion in criteria
+    )
+
+
+def read_zip(data):
+    """Returns one essay per image in the zip, named after the file, in file name order.
+
+    Each essay's 'source' is its path in the zip, which tells apart students with the same name.
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        members = [
+            member for member in archive.infolist()
+            if not member.is_dir()
+            and member.filename.lower().endswith(IMAGE_EXTENSIONS)
+            and not os.path.basename(member.filename).startswith('.')  # e.g. macOS resource forks
+        ]
+        if sum(member.file_size for member in members) > BATCH_MAX_UNCOMPRESSED:
+            raise ValueError("The zip file is too large to process.")
+
+        essays = []
+        for member in sorted(members, key=lambda m: m.filename.lower()):
+            filename = os.path.basename(member.filename)
+            essays.append({
+                'student_name': os.path.splitext(filename)[0],
+                'source': member.filename,
+                'image': (archive.read(member), filename)
+            })
+    return essays
+
+
+def _rows_to_essays(rows):
+    rows = iter(rows)
+    header = next(rows, None)
+    if not header:
+        raise ValueError("The file is empty.")
+    columns = [str(cell or "").strip().lower().replace(' ', '_') for cell in header]
+
+    def find(names):
+        return next((columns.index(name) for name in names if name in columns), None)
+
+    name_column, essay_column = find(NAME_COLUMNS), find(ESSAY_COLUMNS)
+    if essay_column is None:
+        raise ValueError(f"The file needs an essay column (one of: {', '.join(ESSAY_COLUMNS)}).")
+
+    essays = []
+    for row_number, row in enumerate(rows, start=2):
+        cells = ["" if cell is None else str(cell).strip() for cell in row]
+        essay_text = cells[essay_column] if essay_column < len(cells) else ""
+        if not essay_text:
+            continue
+        student_name = cells[name_column] if name_column is not None and name_column < len(cells) else ""
+        essays.append({
+            'student_name': student_name or f"Row {row_number}",
+            'source': f"row {row_number}",
+            'essay_text': essay_text
+        })
+    return essays
+
+
+def read_table(data, filename):
+    """Returns one essay per row of a CSV or XLSX file with a header row, with its row number as 'source'."""
+    if filename.lower().endswith('.xlsx'):
+        import openpyxl
+        workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+        try:
+            return _rows_to_essays(workbook.active.iter_rows(values_only=True))
+        finally:
+            workbook.close()
+    return _rows_to_essays(csv.reader(io.StringIO(data.decode('utf-8-sig'))))
+
+
+def read_essays(data, filename):
+    """Reads a batch upload: a zip of images, a CSV or an XLSX file."""
+    extension = os.path.splitext(filename.lower())[1]
+    if extension == '.zip':
+        essays = read_zip(data)
+    elif extension in ('.csv', '.xlsx'):
+        essays = read_table(data, filename)
+    else:
+        raise ValueError("Upload a .zip of images, a .csv or an .xlsx file.")
+    if not essays:
+        raise ValueError("No essays were found in the file.")
+    return essays
+
+
+def is_failed(entry):
+    """True when the essay, or any of its criteria, still needs to be graded."""
+    return bool(entry.error or entry.result.grade.error or entry.result.grade.failed_criteria)
+
+
+def grade_batch(essays, context_text, criteria, report=None,
+                ocr_workers=None, grade_workers=None, queue_size=None, on_entry=None, checkpoint_key=None):
+    """Reads and grades every essay, returning (BatchEntry records in upload order, stage stats).
+
+    report(event, data), if given, receives an 'essay' event each time an essay
+    changes status (queued, reading, grading, done or failed), a 'progress' event
+    with the running totals, and a 'pipeline_stats' event with each stage's
+    throughput at the end. on_entry(index, entry) is called with each BatchEntry
+    as soon as it is finished.
+
+    With a checkpoint_key, the OCR text, each criterion's grade and each finished
+    essay are saved as soon as they are ready, and a later call with the same key
+    only redoes what is missing or failed.
+    """
+    report = report or (lambda event, data: None)
+    saved = checkpoint_store.load(checkpoint_key) if checkpoint_key else {}
+
+    def checkpoint(unit, value):
+        if checkpoint_key:
+            checkpoint_store.save(checkpoint_key, unit, value)
+
+    def report_status(index, status, entry=None):
+        data = {'index': index, 'student_name': essays[index]['student_name'], 'status': status}
+        if entry is not None:
+            data['final_grade'] = entry.result.grade.final_grade if entry.result else None
+            data['error'] = entry.error
+        report('essay', data)
+
+    entries = [None] * len(essays)
+    for index in range(len(essays)):
+        if f"essay:{index}" in saved:
+            entries[index] = BatchEntry.from_dict(saved[f"essay:{index}"])
+            report_status(index, 'done', entries[index])
+        else:
+            report_status(index, 'queued')
+    pending = [index for index, entry in enumerate(entries) if entry is None]
+    resumed = len(essays) - len(pending)
+    if resumed:
+        print(f"Resuming batch: {resumed} of {len(essays)} essays were already graded")
+
+    progress = {'total': len(essays), 'done': resumed, 'failed': 0, 'resumed': resumed}
+    progress_lock = threading.Lock()  # Every grading worker finishes essays into it
+    report('progress', dict(progress))
+
+    def read(position, index):
+        essay = essays[index]
+        if essay.get('essay_text') is not None:
+            return BatchEntry(essay['student_name'], essay['essay_text'])
+        if f"text:{index}" in saved:
+            return BatchEntry(essay['student_name'], saved[f"text:{index}"])
+        report_status(index, 'reading')
+        essay_text = image_to_text(*essay['image'])
+        if is_ocr_error(essay_text):
+            return BatchEntry(essay['student_name'], error=essay_text)
+        checkpoint(f"text:{index}", essay_text)
+        return BatchEntry(essay['student_name'], essay_text)
+
+    def grade(position, entry):
+        if entry.error:
+            return entry
+        index = pending[position]
+        completed = {
+            criterion_index: tuple(saved[f"criterion:{index}:{criterion_index}"])
+            for criterion_index in range(len(criteria))
+            if f"criterion:{index}:{criterion_index}" in saved
+        }
+        report_status(index, 'grading')
+        entry.result = evaluate_essay(
+            entry.essay_text, context_text, criteria, completed_criteria=completed,
+            on_criterion=lambda criterion_index, result: checkpoint(
+                f"criterion:{index}:{criterion_index}", list(result)
+            )
+        )
+        return entry
+
+    def on_error(position, item, stage_name, error):
+        return BatchEntry(essays[pending[position]]['student_name'], error=f"An error occurred: {str(error)}")
+
+    def on_result(position, entry):
+        index = pending[position]
+        entries[index] = entry
+        failed = is_failed(entry)
+        if not failed:
+            checkpoint(f"essay:{index}", entry.to_dict())
+        report_status(index, 'failed' if failed else 'done', entry)
+        # Reported under the lock too, so the totals never go backwards
+        with progress_lock:
+            progress['failed' if failed else 'done'] += 1
+            report('progress', dict(progress))
+        if on_entry:
+            on_entry(index, entry)
+
+    pipeline = Pipeline([
+        Stage('ocr', read, ocr_workers or BATCH_OCR_WORKERS),
+        Stage('grading', grade, grade_workers or BATCH_GRADE_WORKERS),
+    ], queue_size=queue_size or BATCH_QUEUE_SIZE, on_error=on_error)
+    pipeline.run(pending, on_result)
+
+    stats = pipeline.stats()
+    print("\n===== Batch Pipeline =====")
+    for name, stage in stats.items():
+        print(f"{name}: {stage['processed']} essays, {stage['throughput_per_minute']} per minute, "
+              f"utilization {stage['utilization']}, blocked {stage['blocked_seconds']}s, "
+              f"idle {stage['idle_seconds']}s ({stage['workers']} workers)")
+    print("==========================\n")
+    report('pipeline_stats', stats)
+    return entries, stats
+
+
+def write_gradebook(entries, criteria, path):
+    """Writes an XLSX gradebook: one row per student, one column per criterion."""
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    grades = workbook.active
+    grades.title = "Grades"
+    grades.append(
+        ["Student"] + [f"{criterion['name']} (/{criterion['points_possible']:g})" for criterion in criteria]
+        + ["Total", "Out of", "Notes"]
+    )
+    justifications = workbook.create_sheet("Justifications")
+    justifications.append(["Student"] + [criterion['name'] for criterion in criteria] + ["Summary"])
+
+    for entry in entries:
+        grade = entry.result.grade if entry.result else None
+        if grade is None or grade.error:
+            grades.append([entry.student_name] + [None] * len(criteria) + [None, None, entry.error or grade.error])
+            continue
+        failed = [criterion.name for criterion in grade.failed_criteria]
+        grades.append(
+            [entry.student_name] + [criterion.points_received for criterion in grade.criteria]
+            + [grade.points_received, grade.points_possible, f"Not graded: {', '.join(failed)}" if failed else None]
+        )
+        justifications.append(
+            [entry.student_name] + [criterion.error or criterion.justification for criterion in grade.criteria]
+            + [entry.result.summary]
+        )
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    workbook.save(path)
+    return path
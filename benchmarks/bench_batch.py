@@ -0,0 +1,71 @@
+"""Benchmarks the batch pipeline against reading and grading one essay at a time.
+
+Uses a fake provider with fixed OCR and grading latencies, so the numbers only
+reflect how the stages overlap. Try different stage widths with
+BATCH_OCR_WORKERS and BATCH_GRADE_WORKERS.
+
+Run from the project root:  python benchmarks/bench_batch.py
+"""
+import os
+import sys
+import time
+import tempfile
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="checkmate-bench-"))
+
+import engine  # noqa: E402
+import batch  # noqa: E402
+import image_prep  # noqa: E402
+import fake_provider  # noqa: E402
+
+OCR_LATENCY = float(os.environ.get("BENCH_OCR_LATENCY", 1.0))
+GRADE_LATENCY = float(os.environ.get("BENCH_LATENCY", 0.5))
+ESSAY_COUNT = int(os.environ.get("BENCH_ESSAYS", 20))
+CRITERIA = [
+    {'name': f"Criterion {i + 1}", 'weight': 0.25, 'points_possible': 10.0, 'detailed_breakdown': ''}
+    for i in range(4)
+]
+run_ids = itertools.count(1)
+
+
+def ocr_text(images):
+    return f"Essay {images[0][0].decode()}: " + " ".join(["The industrial revolution changed how people lived."] * 5)
+
+
+def make_essays():
+    run = next(run_ids)
+    return [
+        # Different bytes per image and run keep the OCR cache from answering for the provider
+        {'student_name': f"Student {i + 1}", 'image': (f"run{run}-{i}".encode(), f"student{i + 1}.jpg")}
+        for i in range(ESSAY_COUNT)
+    ]
+
+
+def main():
+    fake_provider.install(engine, grade_latency=GRADE_LATENCY, ocr_latency=OCR_LATENCY, ocr_text=ocr_text)
+    engine.print = batch.print = image_prep.print = lambda *args, **kwargs: None  # Silence the debug logging
+
+    print(f"{ESSAY_COUNT} essays, fake OCR latency {OCR_LATENCY:.2f}s, grading latency {GRADE_LATENCY:.2f}s")
+
+    start = time.perf_counter()
+    for essay in make_essays():
+        essay_text = engine.image_to_text(*essay['image'])
+        engine.evaluate_essay(essay_text, "Explain the industrial revolution.", CRITERIA)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, stats = batch.grade_batch(make_essays(), "Explain the industrial revolution.", CRITERIA)
+    pipelined = time.perf_counter() - start
+
+    print(f"one at a time: {sequential:.2f}s")
+    print(f"pipelined:     {pipelined:.2f}s ({sequential / pipelined:.1f}x)")
+    print(f"{'stage':>8} | {'workers':>7} | {'per min':>8} | {'util':>5} | {'blocked':>8} | {'idle':>8}")
+    for name, stage in stats.items():
+        print(f"{name:>8} | {stage['workers']:>7} | {stage['throughput_per_minute']:>8} | "
+              f"{stage['utilization']:>5} | {stage['blocked_seconds']:>7}s | {stage['idle_seconds']:>7}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Benchmarks grade_essay wall-clock time against the number of rubric criteria.
+
+Uses a fake provider that sleeps for a fixed latency instead of calling GeminiPro,
+so the numbers only reflect how the grading calls are scheduled.
+
+Run from the project root:  python benchmarks/bench_grading.py
+"""
+import os
+import sys
+import time
+import tempfile
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="checkmate-bench-"))
+
+import engine  # noqa: E402
+import fake_provider  # noqa: E402
+
+FAKE_LATENCY = float(os.environ.get("BENCH_LATENCY", 0.5))
+ESSAY = " ".join(["The industrial revolution changed how people lived and worked."] * 20)
+CONTEXT = "Explain the effects of the industrial revolution."
+run_ids = itertools.count(1)
+
+
+def run(criteria_count, concurrency):
+    criteria = [
+        {'name': f"Criterion {i + 1}", 'weight': 0.1, 'points_possible': 10.0, 'detailed_breakdown': ''}
+        for i in range(criteria_count)
+    ]
+    engine.GRADING_CONCURRENCY = concurrency
+    start = time.perf_counter()
+    # A fresh context per run keeps the response cache from answering for the provider
+    engine.grade_essay(ESSAY, f"{CONTEXT} (run {next(run_ids)})", criteria)
+    return time.perf_counter() - start
+
+
+def main():
+    fake_provider.install(engine, grade_latency=FAKE_LATENCY)
+    engine.print = lambda *args, **kwargs: None  # Silence the debug logging in engine.py
+
+    print(f"Fake provider latency: {FAKE_LATENCY:.2f}s")
+    print(f"{'criteria':>8} | {'sequential':>10} | {'concurrent':>10} | {'speedup':>7}")
+    for criteria_count in (1, 2, 4, 6, 8, 12):
+        sequential = run(criteria_count, 1)
+        concurrent = run(criteria_count, int(os.environ.get("GRADING_CONCURRENCY", 4)))
+        print(f"{criteria_count:>8} | {sequential:>9.2f}s | {concurrent:>9.2f}s | {sequential / concurrent:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmarks the bytes and latency of an OCR call with and without image preprocessing.
+
+Pass a directory of real scans to measure them, otherwise a few synthetic
+12-megapixel phone photos of a handwritten page are generated. The OCR call is
+modelled as the upload at BENCH_UPLINK_MBPS plus a fixed BENCH_LATENCY for the
+provider, so the numbers only reflect the image size and the preprocessing time.
+
+Run from the project root:  python benchmarks/bench_ocr_prep.py [scans/]
+"""
+import io
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+import image_prep  # noqa: E402
+from batch import IMAGE_EXTENSIONS  # noqa: E402
+
+UPLINK_MBPS = float(os.environ.get("BENCH_UPLINK_MBPS", 5))
+PROVIDER_LATENCY = float(os.environ.get("BENCH_LATENCY", 2.0))
+SAMPLE_COUNT = int(os.environ.get("BENCH_SAMPLES", 4))
+
+
+def make_photo(seed):
+    """A 4032x3024 JPEG of a written page on a desk, stored sideways with an EXIF rotation like a phone does."""
+    rng = random.Random(seed)
+    photo = Image.new('RGB', (4032, 3024), (120, 100, 80))
+    page = Image.new('RGB', (2400, 2900), (235, 232, 225))
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=56)
+    words = "the industrial revolution changed how people lived and worked in cities".split()
+    for line in range(30):
+        text = " ".join(rng.choice(words) for _ in range(8))
+        draw.text((150, 200 + line * 85), text, fill=(30, 30, 60), font=font)
+    photo.paste(page, (800, 60))
+
+    # Sensor noise is most of what makes real photos large
+    noise = Image.effect_noise(photo.size, 40).convert('RGB')
+    photo = Image.blend(photo, noise, 0.15).rotate(90, expand=True)
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+    output = io.BytesIO()
+    photo.save(output, format='JPEG', quality=92, exif=exif)
+    return output.getvalue(), f"photo{seed + 1}.jpg"
+
+
+def load_samples(path):
+    samples = []
+    for filename in sorted(os.listdir(path)):
+        if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+            with open(os.path.join(path, filename), 'rb') as f:
+                samples.append((f.read(), filename))
+    return samples
+
+
+def call_seconds(size):
+    return size * 8 / (UPLINK_MBPS * 1_000_000) + PROVIDER_LATENCY
+
+
+def main():
+    image_prep.print = lambda *args, **kwargs: None  # Silence the debug logging
+    samples = load_samples(sys.argv[1]) if len(sys.argv) > 1 else [make_photo(i) for i in range(SAMPLE_COUNT)]
+
+    print(f"{len(samples)} images, uplink {UPLINK_MBPS:g} Mbit/s, provider latency {PROVIDER_LATENCY:.2f}s, "
+          f"OCR_MAX_SIDE {image_prep.OCR_MAX_SIDE}")
+    print(f"{'image':>14} | {'before':>9} | {'after':>9} | {'prep':>6} | {'call before':>11} | {'call after':>10}")
+    totals = [0, 0, 0.0, 0.0, 0.0]
+    for image_bytes, filename in samples:
+        start = time.perf_counter()
+        prepared, _, _ = image_prep.prepare_image(image_bytes, filename)
+        prep_seconds = time.perf_counter() - start
+        before, after = call_seconds(len(image_bytes)), prep_seconds + call_seconds(len(prepared))
+        print(f"{filename[:14]:>14} | {len(image_bytes) / 1e6:>7.2f}MB | {len(prepared) / 1e6:>7.2f}MB | "
+              f"{prep_seconds:>5.2f}s | {before:>10.2f}s | {after:>9.2f}s")
+        for i, value in enumerate((len(image_bytes), len(prepared), prep_seconds, before, after)):
+            totals[i] += value
+
+    print(f"{'total':>14} | {totals[0] / 1e6:>7.2f}MB | {totals[1] / 1e6:>7.2f}MB | {totals[2]:>5.2f}s | "
+          f"{totals[3]:>10.2f}s | {totals[4]:>9.2f}s")
+    print(f"{totals[0] / totals[1]:.1f}x fewer bytes, {totals[3] / totals[4]:.1f}x faster per call")
+
+
+if __name__ == "__main__":
+    main()
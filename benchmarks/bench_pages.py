@@ -0,0 +1,50 @@
+"""Benchmarks reading a multi-page essay one page at a time against pages_to_text.
+
+Uses a fake OCR provider with a fixed latency, so the numbers only reflect how
+the page calls are scheduled. Try different widths with OCR_PAGE_CONCURRENCY.
+
+Run from the project root:  python benchmarks/bench_pages.py
+"""
+import os
+import sys
+import time
+import tempfile
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="checkmate-bench-"))
+
+import engine  # noqa: E402
+import image_prep  # noqa: E402
+import fake_provider  # noqa: E402
+
+OCR_LATENCY = float(os.environ.get("BENCH_OCR_LATENCY", 1.0))
+run_ids = itertools.count(1)
+
+
+def make_pages(count):
+    run = next(run_ids)
+    # Different bytes per page and run keep the OCR cache from answering for the provider
+    return [(f"run{run}-page{i}".encode(), f"page{i + 1}.jpg") for i in range(count)]
+
+
+def main():
+    fake_provider.install(engine, ocr_latency=OCR_LATENCY)
+    engine.print = image_prep.print = lambda *args, **kwargs: None  # Silence the debug logging
+
+    print(f"fake OCR latency {OCR_LATENCY:.2f}s, OCR_PAGE_CONCURRENCY {engine.OCR_PAGE_CONCURRENCY}")
+    print(f"{'pages':>5} | {'one at a time':>13} | {'concurrent':>10}")
+    for count in (1, 2, 4):
+        start = time.perf_counter()
+        for page in make_pages(count):
+            engine.image_to_text(*page)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine.pages_to_text(make_pages(count))
+        concurrent = time.perf_counter() - start
+        print(f"{count:>5} | {sequential:>12.2f}s | {concurrent:>9.2f}s")
+
+
+if __name__ == "__main__":
+    main()
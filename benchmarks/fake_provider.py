@@ -0,0 +1,39 @@
+"""Fake provider client shared by the benchmarks.
+
+It sleeps for a fixed latency instead of calling a real provider, so the
+benchmarks only measure how the calls are scheduled.
+"""
+import time
+from types import SimpleNamespace
+
+GRADE_REPLY = "Grade: 8/10\nJustification: The essay is clear and well organized."
+
+
+class FakeCompletions:
+    def __init__(self, grade_latency, ocr_latency, ocr_text):
+        self.grade_latency = grade_latency
+        self.ocr_latency = ocr_latency
+        self.ocr_text = ocr_text
+
+    def create(self, model, messages, images=None, **kwargs):
+        if images:
+            time.sleep(self.ocr_latency)
+            content = self.ocr_text(images)
+        else:
+            time.sleep(self.grade_latency)
+            content = GRADE_REPLY
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeClient:
+    """Answers grading prompts with GRADE_REPLY and OCR requests with ocr_text(images)."""
+
+    def __init__(self, grade_latency=0.5, ocr_latency=1.0, ocr_text=lambda images: f"Text of {images[0][1]}."):
+        self.chat = SimpleNamespace(completions=FakeCompletions(grade_latency, ocr_latency, ocr_text))
+
+
+def install(engine, **options):
+    """Sends every provider call the engine makes to a FakeClient built with options."""
+    fake_client = FakeClient(**options)
+    engine.call_provider = lambda router, request_func, hedger=None: request_func(fake_client, "fake-model")
+    return fake_client
@@ -0,0 +1,38 @@
+import json
+import time
+
+from sqlite_store import SqliteStore
+
+
+class CheckpointStore(SqliteStore):
+    """Finished units of a long run (OCR text, criterion grades, whole essays) in an SQLite file.
+
+    Units are saved as soon as they finish, under the key of the run they belong
+    to, so a run that is restarted after a crash or deploy can load them and
+    only redo the units that are missing.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, (
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "run_key TEXT NOT NULL, unit TEXT NOT NULL, value TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (run_key, unit))",
+        ))
+
+    def load(self, run_key):
+        """Returns every saved unit of the run as {unit: value}."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT unit, value FROM checkpoints WHERE run_key = ?", (run_key,)).fetchall()
+        return {unit: json.loads(value) for unit, value in rows}
+
+    def save(self, run_key, unit, value):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (run_key, unit, value, created_at) VALUES (?, ?, ?, ?)",
+                (run_key, unit, json.dumps(value), time.time())
+            )
+
+    def clear(self, run_key):
+        """Forgets a run once its final result is stored somewhere else."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM checkpoints WHERE run_key = ?", (run_key,))
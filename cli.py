@@ -0,0 +1,162 @@
+"""Grades essays from the command line, without the web app.
+
+    python cli.py essays/ --rubric rubric.txt --context "Explain the causes of WW1" \
+        --output results.jsonl --xlsx gradebook.xlsx
+
+The input is a directory of scans (.jpg, .png, ...) and .txt files, or a
+.csv, .xlsx or .zip file as accepted by the batch upload. The rubric file has
+one "Name | points | breakdown" line per criterion, or is a JSON list of
+criteria. Every finished essay is appended to the JSONL output straight away,
+so an interrupted run picks up where it stopped: essays already graded in the
+output file are skipped, and failed ones are tried again. Essays are matched
+by file name, or by row number in a .csv or .xlsx file, so two students with
+the same name are kept apart.
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+import contextlib
+
+from batch import (
+    BATCH_OCR_WORKERS, BATCH_GRADE_WORKERS, BATCH_QUEUE_SIZE, IMAGE_EXTENSIONS,
+    read_essays, grade_batch, write_gradebook, parse_rubric_text, is_failed
+)
+from grade_results import BatchEntry
+
+
+def read_directory(path):
+    """Returns one essay per image or .txt file in the directory, named after the file, with the file name as 'source'."""
+    essays = []
+    for filename in sorted(os.listdir(path), key=str.lower):
+        full_path = os.path.join(path, filename)
+        student_name, extension = os.path.splitext(filename)
+        if not os.path.isfile(full_path) or filename.startswith('.'):
+            continue
+        if extension.lower() == '.txt':
+            with open(full_path, encoding='utf-8') as f:
+                essays.append({'student_name': student_name, 'source': filename, 'essay_text': f.read().strip()})
+        elif extension.lower() in IMAGE_EXTENSIONS:
+            with open(full_path, 'rb') as f:
+                essays.append({'student_name': student_name, 'source': filename, 'image': (f.read(), filename)})
+    if not essays:
+        raise ValueError(f"No images or .txt files were found in {path}.")
+    return essays
+
+
+def read_rubric(path):
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if path.lower().endswith('.json'):
+        criteria = []
+        for number, criterion in enumerate(json.loads(text), start=1):
+            try:
+                points_possible = float(criterion['points_possible'])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"Rubric criterion {number} needs a number of points in 'points_possible'.")
+            # Same rule as the text format, which also keeps the weights below from dividing by 0
+            if points_possible <= 0:
+                raise ValueError(f"Rubric criterion {number} ('{criterion['name']}'): points must be more than 0.")
+            criteria.append({
+                'name': criterion['name'],
+                'points_possible': points_possible,
+                'detailed_breakdown': criterion.get('detailed_breakdown', "")
+            })
+        total_points_possible = sum(criterion['points_possible'] for criterion in criteria)
+        for criterion in criteria:
+            criterion['weight'] = criterion['points_possible'] / total_points_possible
+    else:
+        criteria = parse_rubric_text(text)
+    if not criteria:
+        raise ValueError(f"The rubric file {path} has no criteria.")
+    return criteria
+
+
+def read_finished(path):
+    """Returns the latest JSONL record per essay source from an earlier run, as BatchEntry objects."""
+    finished = {}
+    if not os.path.exists(path):
+        return finished
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                finished[record['source']] = BatchEntry.from_dict(record)
+    return finished
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Grade a class set of essays against a rubric.")
+    parser.add_argument('input', help="directory of scans and .txt files, or a .csv, .xlsx or .zip file")
+    parser.add_argument('--rubric', required=True, help="rubric file ('Name | points | breakdown' lines, or JSON)")
+    context = parser.add_mutually_exclusive_group(required=True)
+    context.add_argument('--context', help="context for grading, used for every essay")
+    context.add_argument('--context-file', help="file holding the context for grading")
+    parser.add_argument('--output', required=True, help="JSONL file to append results to")
+    parser.add_argument('--xlsx', help="also write a gradebook with every result in the output file")
+    parser.add_argument('--ocr-workers', type=int, default=BATCH_OCR_WORKERS)
+    parser.add_argument('--grade-workers', type=int, default=BATCH_GRADE_WORKERS)
+    parser.add_argument('--queue-size', type=int, default=BATCH_QUEUE_SIZE)
+    parser.add_argument('--quiet', action='store_true', help="hide the engine's debug output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    try:
+        if os.path.isdir(args.input):
+            essays = read_directory(args.input)
+        else:
+            with open(args.input, 'rb') as f:
+                essays = read_essays(f.read(), args.input)
+        criteria = read_rubric(args.rubric)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    if args.context_file:
+        with open(args.context_file, encoding='utf-8') as f:
+            context_text = f.read().strip()
+    else:
+        context_text = args.context
+
+    finished = read_finished(args.output)
+    pending = [
+        essay for essay in essays
+        if essay['source'] not in finished or is_failed(finished[essay['source']])
+    ]
+    print(f"{len(essays)} essays, {len(essays) - len(pending)} already graded in {args.output}", file=sys.stderr)
+
+    output_lock = threading.Lock()
+    saved = []
+
+    def save(index, entry):
+        with output_lock:
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'source': pending[index]['source'], **entry.to_dict()}) + "\n")
+            finished[pending[index]['source']] = entry
+            saved.append(entry.student_name)
+            status = entry.error or entry.result.grade.final_grade
+            print(f"[{len(saved)}/{len(pending)}] {entry.student_name}: {status}", file=sys.stderr)
+
+    if pending:
+        with open(os.devnull, 'w') as devnull, \
+                (contextlib.redirect_stdout(devnull) if args.quiet else contextlib.nullcontext()):
+            grade_batch(pending, context_text, criteria, ocr_workers=args.ocr_workers,
+                        grade_workers=args.grade_workers, queue_size=args.queue_size, on_entry=save)
+
+    entries = [finished[essay['source']] for essay in essays if essay['source'] in finished]
+    if args.xlsx:
+        write_gradebook(entries, criteria, os.path.abspath(args.xlsx))
+        print(f"Gradebook written to {args.xlsx}", file=sys.stderr)
+
+    failed = [entry.student_name for entry in entries if is_failed(entry)]
+    if failed:
+        print(f"{len(failed)} essays failed: {', '.join(failed)}. Run again to retry them.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
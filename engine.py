@@ -0,0 +1,699 @@
+"""Grading engine: OCR, summaries and rubric grading without any Flask or session state.
+
+Every function takes its inputs explicitly, so the engine can be driven by the
+web app, the job workers or any other process that imports it.
+"""
+import os
+import re
+import json
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from response_cache import ResponseCache, make_key
+from retry import RetryBudget, RetryPolicy, retry_call
+from rate_limit import SharedRateLimiter
+from provider_router import build_router
+from hedging import Hedger
+from grade_results import CriterionResult, GradeResult, EssayResult
+from parse_stats import ParseStats
+from image_prep import prepare_image
+from ocr_cache import OcrCache
+
+# Comma-separated list of API keys; every provider call goes to the least-loaded healthy one
+API_KEYS = [
+    key.strip()
+    for key in os.environ.get("GEMINI_API_KEYS", os.environ.get("GEMINI_API_KEY", "Put Your API Key Here")).split(",")
+    if key.strip()
+]
+
+GRADING_MODEL = "gemini-2.5-flash"
+OCR_MODEL = ""  # Empty lets GeminiPro pick its default vision model
+
+# Providers are tried in this order, unless a later one is faster and healthier. Override with e.g.
+# PROVIDER_ROUTES='{"text": [{"provider": "GeminiPro", "model": "gemini-2.5-flash"}, {"provider": "DeepInfraChat", "model": "deepseek-v3"}]}'
+PROVIDER_ROUTES = {
+    'text': [{'provider': "GeminiPro", 'model': GRADING_MODEL}],
+    'ocr': [{'provider': "GeminiPro", 'model': OCR_MODEL}],
+}
+PROVIDER_ROUTES.update(json.loads(os.environ.get("PROVIDER_ROUTES", "{}")))
+
+router_options = dict(
+    key_cooldown=float(os.environ.get("KEY_COOLDOWN", 60)),
+    failure_threshold=int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5)),
+    reset_timeout=float(os.environ.get("BREAKER_RESET_TIMEOUT", 30))
+)
+text_router = build_router(PROVIDER_ROUTES['text'], API_KEYS, **router_options)
+# Part of every text cache key, so replies cached under other routes or models aren't served after a switch
+TEXT_ROUTES_KEY = [(route['provider'], route.get('model', "")) for route in PROVIDER_ROUTES['text']]
+ocr_router = build_router(PROVIDER_ROUTES['ocr'], API_KEYS, **router_options)
+
+# Bump a version whenever its prompt changes so cached responses to the old prompt are not reused
+PROMPT_VERSIONS = {'ocr': 1, 'summary': 1, 'grade': 1, 'rubric': 1}
+
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+response_cache = ResponseCache(
+    os.path.join(CACHE_DIR, "responses.sqlite3"),
+    max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", 1024)),
+    ttl=float(os.environ.get("CACHE_TTL", 7 * 24 * 3600)),
+    max_disk_entries=int(os.environ.get("CACHE_MAX_DISK_ENTRIES", 50000))
+)
+
+# Text already extracted from an image, found again when the same photo is uploaded or re-encoded
+ocr_cache = OcrCache(
+    os.path.join(CACHE_DIR, "ocr.sqlite3"),
+    max_entries=int(os.environ.get("OCR_CACHE_MAX_ENTRIES", 4096)),
+    ttl=float(os.environ.get("OCR_CACHE_TTL", 30 * 24 * 3600)),
+    # Bits of the 1024-bit perceptual hash that may differ for two photos to count as the same page.
+    # Unset turns near matches off: a re-encoded copy of a page measured 5-15 bits away, but two
+    # different pages with only a line of writing each can be as close as ~20
+    max_distance=int(os.environ["OCR_CACHE_MAX_DISTANCE"]) if os.environ.get("OCR_CACHE_MAX_DISTANCE") else None
+)
+
+# How often each model's grading replies break the requested format
+parse_stats = ParseStats(os.path.join(CACHE_DIR, "parse_stats.sqlite3"))
+
+# Token buckets per model and API key, shared by all gunicorn workers, e.g.
+# RATE_LIMITS='{"gemini-2.5-flash": {"rate": 0.2, "capacity": 5}, "default": {"rate": 0.5, "capacity": 5}}'
+# Models without a limit here (and no "default") are not rate limited at all
+rate_limiter = SharedRateLimiter(
+    os.path.join(CACHE_DIR, "rate_limits.sqlite3"),
+    limits=json.loads(os.environ.get("RATE_LIMITS", "{}")),
+    max_wait=float(os.environ.get("RATE_LIMIT_MAX_WAIT", 60))
+)
+
+# Optional duplicate requests for calls that run slower than HEDGE_PERCENTILE of recent latency
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "0") == "1"
+text_hedger = Hedger(
+    percentile=float(os.environ.get("HEDGE_PERCENTILE", 95)),
+    max_ratio=float(os.environ.get("HEDGE_MAX_RATIO", 0.1)),
+    min_samples=int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+)
+
+def call_provider(router, request_func, hedger=None):
+    """Runs request_func(client, model) on the router's best route, once the rate limiter has a slot.
+
+    With a hedger, a slow call gets a duplicate on another route (or key) and the first answer wins.
+    """
+    def call(key, route):
+        return request_func(key.client, route.model)
+
+    # The wait for a slot is kept out of the latencies the router, key pool and hedger measure
+    def wait_for_slot(key, route):
+        rate_limiter.acquire(route.model, key.api_key)
+    if hedger is None:
+        return router.call(call, before=wait_for_slot)
+
+    def hedged_call(is_hedge, mark_sent):
+        def before(key, route):
+            wait_for_slot(key, route)
+            mark_sent()
+        return router.call(call, avoid_best=is_hedge, before=before)
+    return hedger.call(hedged_call)
+
+def call_text_provider(request_func):
+    """call_provider for summary and grading requests, hedged when HEDGE_ENABLED is set."""
+    return call_provider(text_router, request_func, text_hedger if HEDGE_ENABLED else None)
+
+def complete_text(messages, on_partial=None, flush_interval=0.15, with_model=False):
+    """Sends a text prompt through the retry layer and returns the reply, or None if there was none.
+
+    With on_partial, the reply is streamed and on_partial(text_so_far) is called at
+    every line break and at most every flush_interval seconds in between. It gets
+    the whole text so far rather than the new tokens, so a retried stream simply
+    starts over. Streamed calls are never hedged, since both copies would report.
+
+    with_model returns (reply, model that wrote it) instead, since failover may
+    have sent the prompt to another model than the first route's.
+    """
+    if on_partial is None:
+        response, model = retry_call(lambda: call_text_provider(
+            lambda client, model: (client.chat.completions.create(model=model, messages=messages), model)
+        ), retry_policy)
+        text = response.choices[0].message.content.strip() if response.choices else None
+        return (text, model) if with_model else text
+
+    def consume_stream(client, model):
+        text = flushed = ""
+        last_flush = time.monotonic()
+        for chunk in client.chat.completions.create(model=model, messages=messages, stream=True):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            text += delta
+            if "\n" in delta or time.monotonic() - last_flush >= flush_interval:
+                on_partial(text)
+                flushed, last_flush = text, time.monotonic()
+        if text != flushed:
+            on_partial(text)
+        return text.strip(), model
+
+    text, model = retry_call(lambda: call_provider(text_router, consume_stream), retry_policy)
+    return (text, model) if with_model else text
+
+# Retries for rate limits and transient provider errors, limited per process by a retry budget
+retry_policy = RetryPolicy(
+    max_retries=int(os.environ.get("RETRY_MAX_RETRIES", 3)),
+    base_delay=float(os.environ.get("RETRY_BASE_DELAY", 1)),
+    max_delay=float(os.environ.get("RETRY_MAX_DELAY", 30)),
+    deadline=float(os.environ.get("RETRY_DEADLINE", 90)),
+    budget=RetryBudget(ratio=float(os.environ.get("RETRY_BUDGET_RATIO", 0.2)))
+)
+
+# Maximum number of criteria graded at the same time for a single essay
+GRADING_CONCURRENCY = max(1, int(os.environ.get("GRADING_CONCURRENCY", 4)))
+
+# Maximum number of pages of one essay read at the same time
+OCR_PAGE_CONCURRENCY = max(1, int(os.environ.get("OCR_PAGE_CONCURRENCY", 4)))
+
+# "per_criterion" sends one request per criterion, "whole_rubric" grades every criterion in one request
+GRADING_MODE = os.environ.get("GRADING_MODE", "per_criterion")
+
+# Shared deadline (in seconds) for the summary and grading stages of evaluate_essay
+PROCESS_ESSAY_TIMEOUT = float(os.environ.get("PROCESS_ESSAY_TIMEOUT", 120))
+
+# Runs the independent stages of evaluate_essay side by side
+stage_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("STAGE_WORKERS", 8)))
+
+grade_pattern = re.compile(r"Grade:\s*(\d+(\.\d+)?)\/(\d+)")
+justification_pattern = re.compile(r"Justification:\s*(.*)", re.DOTALL)
+json_object_pattern = re.compile(r"\{.*\}", re.DOTALL)
+
+def check_grade_reply(raw_grade, points_possible):
+    """Parses a "Grade: x/y / Justification: ..." reply.
+
+    Returns (points_received, justification, problem), where problem describes
+    what is wrong with the reply, or is None when it can be used as is.
+    """
+    grade_match = grade_pattern.search(raw_grade)
+    if not grade_match:
+        return None, None, f"it has no line of the form 'Grade: [numeric value]/{points_possible:g}'"
+    points_received = float(grade_match.group(1))
+    if not 0 <= points_received <= points_possible:
+        return None, None, f"the grade {points_received:g} is not between 0 and {points_possible:g}"
+
+    justification_match = justification_pattern.search(raw_grade)
+    justification = justification_match.group(1).strip() if justification_match else ""
+    if not justification:
+        return None, None, "it has no 'Justification:' with a justification after it"
+    return points_received, justification, None
+
+def image_to_text(image_bytes, filename):
+    """Extracts the plain text from an image, or returns a message saying why it couldn't."""
+    try:
+        print("\n===== Image Processing Start =====")
+        print(f"Received image: {filename}")
+
+        upload_digest = hashlib.sha256(image_bytes).hexdigest()
+        cached_text = ocr_cache.get_upload(upload_digest, PROMPT_VERSIONS['ocr'])
+        if cached_text is not None:
+            print("Using cached text for this image.")
+            return cached_text
+
+        prepared_bytes, prepared_filename, fingerprint = prepare_image(image_bytes, filename)
+        image_digest = hashlib.sha256(prepared_bytes).hexdigest()
+        cached_text = ocr_cache.get_image(image_digest, PROMPT_VERSIONS['ocr'])
+        if cached_text is not None:
+            print("Using cached text for an earlier copy of this image.")
+            ocr_cache.set(upload_digest, image_digest, fingerprint, PROMPT_VERSIONS['ocr'], cached_text)
+            return cached_text
+        cached_text = ocr_cache.get_similar(fingerprint, PROMPT_VERSIONS['ocr'])
+        if cached_text is not None:
+            # Not stored under this upload: a similar photo may still be another page
+            print("Using cached text for a similar image.")
+            return cached_text
+
+        # Sending the bytes instead of the upload stream lets a retry resend the same image
+        images = [[prepared_bytes, prepared_filename]]
+
+        print("Sending image to AI for text extraction...")
+        response = retry_call(lambda: call_provider(ocr_router, lambda client, model: client.chat.completions.create(
+            messages=[{
+                "content": (
+                    "Extract only the plain text from this image. "
+                    "Do not use any special symbols like # or *. "
+                    "If there are crossed-out words, ignore them as they are erasures. "
+                    "Only include the readable text without any formatting."
+                ),
+                "role": "user"
+            }],
+            model=model,
+            images=images
+        )), retry_policy)
+
+        if hasattr(response, 'choices') and len(response.choices) > 0:
+            raw_content = response.choices[0].message.content
+            sanitized_content = raw_content.replace("#", "").replace("*", "").strip()
+
+            print("\n===== AI Response =====")
+            print(f"Raw extracted content: {raw_content}")
+            print(f"Sanitized content: {sanitized_content}")
+            print("=========================\n")
+
+            if not sanitized_content:
+                return "No text could be extracted."
+            ocr_cache.set(upload_digest, image_digest, fingerprint, PROMPT_VERSIONS['ocr'], sanitized_content)
+            return sanitized_content
+        
+        print("No text extracted from the image.")
+        return "No text could be extracted."
+
+    except Exception as e:
+        print("\n===== Error Occurred =====")
+        print(f"Error during image processing: {e}")
+        print("=========================\n")
+        return f"An error occurred during image processing: {str(e)}"
+
+def cached_image_text(upload_sha256, count=True):
+    """Returns the text already extracted from an image with this SHA-256, without the image itself, or None."""
+    return ocr_cache.get_upload(upload_sha256.lower(), PROMPT_VERSIONS['ocr'], count=count)
+
+def is_ocr_error(text):
+    """Tells the messages image_to_text returns instead of text apart from extracted text."""
+    return text == "No text could be extracted." or text.startswith("An error occurred during image processing")
+
+def pages_to_text(pages):
+    """Extracts the text of an essay written over several pages, reading the pages at the same time.
+
+    Each page is (image_bytes, filename), or the SHA-256 of an image whose text is
+    already cached. Returns (text, error): the texts joined in page order, or the
+    message of the first page that couldn't be read, prefixed with its page number.
+    """
+    def read_page(page):
+        if isinstance(page, str):
+            text = cached_image_text(page)
+            return text if text is not None else "An error occurred during image processing: the image is no longer cached, please choose it again."
+        return image_to_text(*page)
+
+    # Every page is its own OCR call, so each one can hit the OCR cache and be retried on its own
+    with ThreadPoolExecutor(max_workers=min(OCR_PAGE_CONCURRENCY, max(1, len(pages)))) as executor:
+        texts = list(executor.map(read_page, pages))
+
+    for number, text in enumerate(texts, 1):
+        if is_ocr_error(text):
+            return None, text if len(pages) == 1 else f"Page {number}: {text}"
+    return "\n\n".join(texts), None
+
+def generate_summary(text, on_partial=None):
+    if len(text.split()) < 20:
+        return "Error: The text inputted must not have lesser than 20 words."
+
+    cache_key = make_key('summary', TEXT_ROUTES_KEY, PROMPT_VERSIONS['summary'], text)
+    cached_summary = response_cache.get(cache_key)
+    if cached_summary is not None:
+        return cached_summary
+
+    try:
+        summary = complete_text(
+            [{"role": "user", "content": f"Summarize this text:\n\n{text}"}],
+            on_partial=on_partial
+        )
+        if summary is None:
+            return "No summary could be generated."
+        response_cache.set(cache_key, summary)
+        return summary
+    except Exception as e:
+        return f"An error occurred during summarization: {str(e)}"
+    
+def grade_criterion(essay_text, context_text, criterion, on_partial=None):
+    """Grades the essay against a single criterion and returns (points_received, justification).
+
+    With on_partial, the reply is streamed and on_partial(points_received, justification_so_far)
+    is called as it arrives; points_received is None until the model has written its Grade line.
+    """
+    truncated_essay = essay_text[:1000]  # Limiting to 1000 characters
+
+    cache_key = make_key(
+        'grade', TEXT_ROUTES_KEY, PROMPT_VERSIONS['grade'], truncated_essay, context_text,
+        criterion['name'], criterion['points_possible']
+    )
+    cached_grade = response_cache.get(cache_key)
+    if cached_grade is not None:
+        print(f"Using cached grade for criterion: {criterion['name']}")
+        return tuple(cached_grade)
+
+    # Debugging: Log what is being sent to the AI
+    print("\n===== Sending to AI =====")
+    print(f"Criterion: {criterion['name']}")
+    print(f"Points Possible: {criterion['points_possible']}")
+    print(f"Essay (first 1000 chars): {truncated_essay}")
+    print(f"Context: {context_text}")
+    print("=========================\n")
+
+    def parse_partial(text):
+        grade_match = grade_pattern.search(text)
+        justification_match = justification_pattern.search(text)
+        on_partial(
+            float(grade_match.group(1)) if grade_match else None,
+            justification_match.group(1) if justification_match else ""
+        )
+
+    messages = [{
+            "role": "user",
+            "content": (
+                f"Grade the following student work based on the criterion '{criterion['name']}' out of {criterion['points_possible']} points.\n\n"
+                f"Context from teacher: {context_text}\n\n"
+                "When grading, consider:\n"
+                f"1. How well the student addresses the specific requirements of '{criterion['name']}'\n"
+                "2. Both the strengths and areas for improvement in the student's work\n"
+                "3. The depth of understanding demonstrated, not just surface-level content\n"
+                "4. The appropriate use of concepts and terminology related to the topic\n\n"
+                "be fair with the assessment. Only assign a failing grade if the student work shows no clear connection to the required topic or criterion.\n\n"
+                f"Essay to grade: {truncated_essay}\n\n"
+                "Your response should follow this format:\n"
+                f"Grade: [numeric value]/{criterion['points_possible']}\n"
+                "Justification: [ 3-sentence detailed justification including examples]"
+            )
+        }]
+    raw_grade, model = complete_text(messages, on_partial=parse_partial if on_partial else None, with_model=True)
+    if raw_grade is None:
+        raise ValueError(f"No grade was returned for criterion '{criterion['name']}'")
+
+    # Debugging: Log AI Response
+    print("\n===== AI Response =====")
+    print(raw_grade)
+    print("=======================\n")
+
+    points_received, justification, problem = check_grade_reply(raw_grade, criterion['points_possible'])
+    if problem:
+        # One short follow-up in the same conversation, instead of re-sending the whole essay as a new request
+        print(f"Reply for criterion '{criterion['name']}' is unusable ({problem}), asking for a corrected one")
+        corrected = complete_text(
+            messages + [
+                {"role": "assistant", "content": raw_grade},
+                {
+                    "role": "user",
+                    "content": (
+                        f"Your reply can't be used because {problem}. Reply again with only these two lines:\n"
+                        f"Grade: [numeric value between 0 and {criterion['points_possible']}]/{criterion['points_possible']}\n"
+                        "Justification: [ 3-sentence detailed justification including examples]"
+                    )
+                }
+            ],
+            on_partial=parse_partial if on_partial else None
+        )
+        print(f"Corrected reply: {corrected}")
+        points_received, justification, problem = check_grade_reply(corrected or "", criterion['points_possible'])
+        parse_stats.record(model, 'grade', 'failed' if problem else 'corrected')
+        if problem:
+            raise ValueError(f"The reply for criterion '{criterion['name']}' could not be used: {problem}")
+    else:
+        parse_stats.record(model, 'grade', 'valid')
+
+    response_cache.set(cache_key, [points_received, justification])
+    return points_received, justification
+
+def grade_criteria_concurrently(essay_text, context_text, criteria, on_result=None, on_partial=None):
+    """Grades each criterion with its own request and returns the results in rubric order.
+
+    A criterion whose request fails has the exception in place of its result, so
+    one failure doesn't throw away the criteria that were graded.
+    on_result(index, result) is called as soon as each criterion is graded, and
+    on_partial(index, points_received, justification_so_far) while its reply streams in.
+    """
+    # Every criterion is an independent request, so they are sent out together
+    max_workers = min(GRADING_CONCURRENCY, len(criteria))
+    results = [None] * len(criteria)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                grade_criterion, essay_text, context_text, criterion,
+                on_partial and (lambda points, justification, i=i: on_partial(i, points, justification))
+            ): i
+            for i, criterion in enumerate(criteria)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                print(f"Error grading criterion '{criteria[i]['name']}': {e}")
+                results[i] = e
+                continue
+            if on_result:
+                on_result(i, results[i])
+    return results
+
+def parse_rubric_response(raw_response, criteria):
+    """Parses the JSON reply of a whole-rubric request.
+
+    Returns a list aligned with criteria holding (points_received, justification),
+    or None for every criterion that is missing or malformed.
+    """
+    results = [None] * len(criteria)
+
+    json_match = json_object_pattern.search(raw_response)
+    if not json_match:
+        return results
+    try:
+        data = json.loads(json_match.group(0))
+    except ValueError:
+        return results
+
+    entries = data.get('criteria') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return results
+
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get('index')
+        if isinstance(index, bool) or not isinstance(index, int) or not 1 <= index <= len(criteria):
+            continue
+        criterion = criteria[index - 1]
+        grade = entry.get('grade')
+        justification = entry.get('justification')
+        if isinstance(grade, bool) or not isinstance(grade, (int, float)):
+            continue
+        if not 0 <= grade <= criterion['points_possible']:
+            continue
+        if not isinstance(justification, str) or not justification.strip():
+            continue
+        results[index - 1] = (float(grade), justification.strip())
+
+    return results
+
+def grade_rubric(essay_text, context_text, criteria, on_result=None, on_partial=None):
+    """Grades every criterion in a single request, re-asking only the criteria that come back invalid."""
+    truncated_essay = essay_text[:1000]  # Limiting to 1000 characters
+
+    rubric_lines = "\n".join(
+        f"{i + 1}. {criterion['name']} (out of {criterion['points_possible']} points)"
+        + (f": {criterion['detailed_breakdown']}" if criterion.get('detailed_breakdown') else "")
+        for i, criterion in enumerate(criteria)
+    )
+
+    print("\n===== Sending to AI (whole rubric) =====")
+    print(f"Criteria: {len(criteria)}")
+    print(f"Essay (first 1000 chars): {truncated_essay}")
+    print(f"Context: {context_text}")
+    print("========================================\n")
+
+    cache_key = make_key(
+        'rubric', TEXT_ROUTES_KEY, PROMPT_VERSIONS['rubric'], truncated_essay, context_text,
+        [(criterion['name'], criterion['points_possible'], criterion.get('detailed_breakdown')) for criterion in criteria]
+    )
+    raw_response = response_cache.get(cache_key)
+    model = None  # Set only for a fresh reply, so cached replies are not counted twice in parse_stats
+    if raw_response is None:
+        try:
+            response, model = retry_call(lambda: call_text_provider(lambda client, model: (client.chat.completions.create(
+                model=model,
+                messages=[{
+                    "role": "user",
+                    "content": (
+                        "Grade the following student work against every criterion of the rubric below.\n\n"
+                        f"Context from teacher: {context_text}\n\n"
+                        f"Rubric:\n{rubric_lines}\n\n"
+                        "When grading, consider:\n"
+                        "1. How well the student addresses the specific requirements of each criterion\n"
+                        "2. Both the strengths and areas for improvement in the student's work\n"
+                        "3. The depth of understanding demonstrated, not just surface-level content\n"
+                        "4. The appropriate use of concepts and terminology related to the topic\n\n"
+                        "be fair with the assessment. Only assign a failing grade if the student work shows no clear connection to the required topic or criterion.\n\n"
+                        f"Essay to grade: {truncated_essay}\n\n"
+                        "Respond with only a JSON object that follows this schema, with one entry per rubric criterion:\n"
+                        '{"criteria": [{"index": <criterion number>, "grade": <number between 0 and the points possible>, '
+                        '"justification": "<3-sentence detailed justification including examples>"}]}'
+                    )
+                }]
+            ), model)), retry_policy)
+            raw_response = response.choices[0].message.content.strip()
+            response_cache.set(cache_key, raw_response)
+        except Exception as e:
+            print(f"Error during whole-rubric grading: {e}")
+            raw_response = ""
+
+    print("\n===== AI Response (whole rubric) =====")
+    print(raw_response)
+    print("======================================\n")
+
+    results = parse_rubric_response(raw_response, criteria)
+    if model is not None:
+        parse_stats.record(model, 'rubric', 'valid' if all(result is not None for result in results) else 'failed')
+    if on_result:
+        for i, result in enumerate(results):
+            if result is not None:
+                on_result(i, result)
+
+    # Only the criteria the model skipped or answered badly are sent again
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        print(f"Re-asking {len(missing)} criteria: {[criteria[i]['name'] for i in missing]}")
+        retried = grade_criteria_concurrently(
+            essay_text, context_text, [criteria[i] for i in missing],
+            on_result=on_result and (lambda j, result: on_result(missing[j], result)),
+            on_partial=on_partial and (lambda j, points, justification: on_partial(missing[j], points, justification))
+        )
+        for i, result in zip(missing, retried):
+            results[i] = result
+
+    return results
+
+def grade_essay(essay_text, context_text, criteria, mode=None, on_result=None, on_partial=None,
+                completed=None):
+    """Grades an essay against the rubric criteria using AI with retry handling for rate limits.
+
+    Returns a GradeResult, whose error is set when the essay could not be graded at all.
+    Criteria that fail on their own are kept in it with their error set.
+    on_result(index, (points_received, justification)) is called as each criterion is graded,
+    and on_partial(index, points_received, justification_so_far) while its reply streams in.
+    completed maps criterion indexes to (points_received, justification) results from an
+    earlier run; only the other criteria are sent to the model.
+    """
+    if len(essay_text.split()) < 20:
+        return GradeResult(error="Error: Ang input na teksto ay dapat magkaroon ng hindi bababa sa 20 salita.")
+
+    if not criteria:
+        return GradeResult(error="No criteria set for grading.")
+
+    if sum(criterion['points_possible'] for criterion in criteria) == 0:
+        return GradeResult(error="No valid criteria to grade the essay.")
+
+    mode = mode or GRADING_MODE
+    completed = completed or {}
+    results = [completed.get(i) for i in range(len(criteria))]
+    remaining = [i for i, result in enumerate(results) if result is None]
+    if remaining:
+        print(f"Grading {len(remaining)} of {len(criteria)} criteria")
+        grade_all = grade_rubric if mode == "whole_rubric" else grade_criteria_concurrently
+        try:
+            graded = grade_all(
+                essay_text, context_text, [criteria[i] for i in remaining],
+                on_result and (lambda j, result: on_result(remaining[j], result)),
+                on_partial and (lambda j, points, justification: on_partial(remaining[j], points, justification))
+            )
+        except Exception as e:
+            print(f"Error during AI grading: {e}")
+            return GradeResult(error=f"An error occurred while grading: {str(e)}")
+        for i, result in zip(remaining, graded):
+            results[i] = result
+
+    return GradeResult([
+        CriterionResult(criterion['name'], criterion['points_possible'], None, "",
+                        error=f"An error occurred while grading: {str(result)}")
+        if isinstance(result, Exception)
+        else CriterionResult(criterion['name'], criterion['points_possible'], *result)
+        for criterion, result in zip(criteria, results)
+    ])
+
+def timed_stage(name, timings, func):
+    """Runs a single stage of evaluate_essay and records how long it took."""
+    start = time.perf_counter()
+    try:
+        return func()
+    finally:
+        timings[name] = time.perf_counter() - start
+
+def evaluate_essay(original_text, context_text, criteria, report=None, completed_criteria=None,
+                   on_criterion=None, summary=None):
+    """Summarizes and grades an essay, running both at the same time under one shared deadline.
+
+    Returns an EssayResult with the summary, the GradeResult and the stage timings. A stage
+    that fails or misses the deadline is reported as an error message so the other
+    stage can still be shown. report(event, data), if given, receives the summary
+    and each criterion as soon as they are ready, streamed as they are written.
+    Without it nothing is streamed, so the calls can be hedged. completed_criteria
+    is passed to grade_essay as completed, and on_criterion(index, (points_received,
+    justification)) is called for each newly graded criterion. A summary from an earlier run is
+    reused instead of generating a new one.
+    """
+    timings = {}
+    start = time.perf_counter()
+    streaming = report is not None
+    report = report or (lambda event, data: None)
+
+    def summarize():
+        result = summary or generate_summary(
+            original_text,
+            on_partial=(lambda text: report('summary_partial', {'summary': text})) if streaming else None
+        )
+        report('summary', {'summary': result})
+        return result
+
+    def report_partial_criterion(index, points_received, justification):
+        report('criterion_partial', {
+            'index': index,
+            'grade': f"{points_received}/{criteria[index]['points_possible']}" if points_received is not None else None,
+            'justification': justification
+        })
+
+    def report_criterion(index, result, is_new=True):
+        if on_criterion and is_new:
+            on_criterion(index, result)
+        points_received, justification = result
+        report('criterion', {
+            'index': index,
+            'name': criteria[index]['name'],
+            'grade': f"{points_received}/{criteria[index]['points_possible']}",
+            'justification': justification
+        })
+
+    def grade():
+        for index, result in (completed_criteria or {}).items():
+            report_criterion(index, result, is_new=False)
+        grade_result = grade_essay(original_text, context_text, criteria,
+                                   on_result=report_criterion,
+                                   on_partial=report_partial_criterion if streaming else None,
+                                   completed=completed_criteria)
+        for index, criterion in enumerate(grade_result.criteria):
+            if criterion.error:
+                report('criterion', {
+                    'index': index,
+                    'name': criterion.name,
+                    'grade': criterion.grade,
+                    'justification': criterion.error,
+                    'failed': True
+                })
+        return grade_result
+
+    summary_future = stage_executor.submit(timed_stage, 'summary', timings, summarize)
+    grade_future = stage_executor.submit(timed_stage, 'grading', timings, grade)
+
+    wait([summary_future, grade_future], timeout=PROCESS_ESSAY_TIMEOUT)
+
+    def stage_result(future, label):
+        """Returns (result, error message)."""
+        if not future.done():
+            future.cancel()
+            return None, f"An error occurred during {label}: timed out after {PROCESS_ESSAY_TIMEOUT:g} seconds"
+        try:
+            return future.result(), None
+        except Exception as e:
+            return None, f"An error occurred during {label}: {str(e)}"
+
+    summary_result, summary_error = stage_result(summary_future, "summarization")
+    grade_result, grade_error = stage_result(grade_future, "grading")
+    summary_result = summary_error or summary_result
+    grade_result = GradeResult(error=grade_error) if grade_error else grade_result
+    report('final_grade', {'final_grade': grade_result.final_grade})
+
+    total = time.perf_counter() - start
+    timings = dict(timings)  # Stages that missed the deadline may still be writing to it
+    sequential = sum(timings.values())
+    print("\n===== Stage Timing =====")
+    for name, elapsed in timings.items():
+        print(f"{name}: {elapsed:.2f}s")
+    print(f"total: {total:.2f}s (saved {max(sequential - total, 0):.2f}s vs. running sequentially)")
+    print("========================\n")
+
+    return EssayResult(summary_result, grade_result, timings)
@@ -0,0 +1,118 @@
+class CriterionResult:
+    """The grade one rubric criterion received, or the error that kept it from being graded."""
+
+    __slots__ = ('name', 'points_possible', 'points_received', 'justification', 'error')
+
+    def __init__(self, name, points_possible, points_received, justification, error=None):
+        self.name = name
+        self.points_possible = points_possible
+        self.points_received = points_received
+        self.justification = justification
+        self.error = error
+
+    @property
+    def grade(self):
+        if self.error:
+            return "Not graded"
+        return f"{self.points_received}/{self.points_possible}"
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data['points_possible'], data['points_received'], data['justification'],
+                   data.get('error'))
+
+
+class GradeResult:
+    """The grades of every criterion of an essay, or the error that kept it from being graded."""
+
+    __slots__ = ('criteria', 'error')
+
+    def __init__(self, criteria=(), error=None):
+        self.criteria = list(criteria)
+        self.error = error
+
+    @property
+    def points_received(self):
+        return sum(criterion.points_received for criterion in self.criteria if not criterion.error)
+
+    @property
+    def points_possible(self):
+        return sum(criterion.points_possible for criterion in self.criteria)
+
+    @property
+    def failed_criteria(self):
+        return [criterion for criterion in self.criteria if criterion.error]
+
+    @property
+    def final_grade(self):
+        """The line shown above the criteria: the total grade, or the error message."""
+        if self.error:
+            return self.error
+        final_grade = f"Final Grade: {self.points_received}/{self.points_possible}"
+        if self.failed_criteria:
+            final_grade += f" (partial: {len(self.failed_criteria)} of {len(self.criteria)} criteria not graded)"
+        return final_grade
+
+    def to_text(self):
+        """Plain-text report used for the downloadable results file."""
+        if self.error:
+            return self.error
+        lines = [
+            f"Criterion: {criterion.name} - Grade: {criterion.grade} - "
+            + (f"Error: {criterion.error}" if criterion.error else f"Justification: {criterion.justification}")
+            for criterion in self.criteria
+        ]
+        return f"{self.final_grade}\n\n" + "\n".join(lines)
+
+    def to_dict(self):
+        return {'criteria': [criterion.to_dict() for criterion in self.criteria], 'error': self.error}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([CriterionResult.from_dict(criterion) for criterion in data['criteria']], data.get('error'))
+
+
+class EssayResult:
+    """Everything evaluate_essay produces for one essay."""
+
+    __slots__ = ('summary', 'grade', 'timings')
+
+    def __init__(self, summary, grade, timings=None):
+        self.summary = summary
+        self.grade = grade
+        self.timings = timings or {}
+
+    def to_dict(self):
+        return {'summary': self.summary, 'grade': self.grade.to_dict(), 'timings': self.timings}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['summary'], GradeResult.from_dict(data['grade']), data.get('timings'))
+
+
+class BatchEntry:
+    """One student's essay in a batch and its EssayResult, or the error that stopped it."""
+
+    __slots__ = ('student_name', 'essay_text', 'result', 'error')
+
+    def __init__(self, student_name, essay_text="", result=None, error=None):
+        self.student_name = student_name
+        self.essay_text = essay_text
+        self.result = result
+        self.error = error
+
+    def to_dict(self):
+        return {
+            'student_name': self.student_name,
+            'essay_text': self.essay_text,
+            'result': self.result.to_dict() if self.result else None,
+            'error': self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        result = EssayResult.from_dict(data['result']) if data.get('result') else None
+        return cls(data['student_name'], data.get('essay_text', ""), result, data.get('error'))
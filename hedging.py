@@ -0,0 +1,120 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+
+
+class Hedger:
+    """Sends a duplicate request when the first one is slower than usual.
+
+    The hedge fires after the `percentile` of recent successful latencies. At
+    most `max_ratio` of calls are hedged, and nothing is hedged until
+    `min_samples` latencies have been seen. The first answer wins. A running
+    provider call can't be interrupted, so the loser is left to finish in the
+    background and its result is thrown away.
+
+    A call that can't be hedged runs in the caller's thread. One that can runs
+    on a thread of its own, started right away, so no call waits for a free
+    worker and the hedge timer only counts time spent on the request.
+    """
+
+    def __init__(self, percentile=95, max_ratio=0.1, min_samples=20, window=200):
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def hedge_delay(self):
+        """Returns how long to wait before hedging, or None if hedging isn't allowed right now."""
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            if self.hedged + 1 > self.max_ratio * self.calls:
+                return None
+            ordered = sorted(self.latencies)
+            index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+            return ordered[index]
+
+    def _timed(self, func, is_hedge, sent=None):
+        """Runs func(is_hedge, mark_sent) and records its latency from when it called mark_sent()."""
+        sent = sent or Future()
+
+        def mark_sent():
+            if not sent.done():
+                sent.set_result(time.perf_counter())
+
+        start = time.perf_counter()
+        result = func(is_hedge, mark_sent)
+        with self._lock:
+            self.latencies.append(time.perf_counter() - (sent.result() if sent.done() else start))
+        return result
+
+    def _start(self, func, is_hedge, sent=None):
+        """Runs _timed(func, is_hedge, sent) on a new thread and returns a Future for its result."""
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            try:
+                future.set_result(self._timed(func, is_hedge, sent))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="hedged-call", daemon=True).start()
+        return future
+
+    def call(self, func):
+        """Calls func(is_hedge, mark_sent) and, if it runs long, a hedge as well; returns the first result.
+
+        func calls mark_sent() just before its request goes out. Time before that,
+        such as waiting for a rate limit slot, neither counts towards the hedge
+        delay nor goes into the latency samples.
+        """
+        with self._lock:
+            self.calls += 1
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._timed(func, False)
+
+        sent = Future()
+        primary = self._start(func, False, sent)
+        wait([primary, sent], return_when=FIRST_COMPLETED)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            # Checked again, since calls running at the same time all got a delay before any of them hedged
+            allowed = self.hedged + 1 <= self.max_ratio * self.calls
+            if allowed:
+                self.hedged += 1
+        if not allowed:
+            return primary.result()
+        print(f"Request slower than {delay:.2f}s, sending a hedged request")
+        backup = self._start(func, True)
+
+        pending = {primary, backup}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'samples': len(self.latencies),
+            }
@@ -0,0 +1,117 @@
+import io
+import os
+
+try:
+    from PIL import Image, ImageChops, ImageFilter, ImageOps
+except ImportError:  # Without Pillow, images are sent to the OCR provider as uploaded
+    Image = None
+
+try:
+    # HEIC photos from iPhones can only be opened with the pillow-heif plugin
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pass
+
+# Longest side (in pixels) of the image sent for OCR; handwriting stays readable well below a phone camera's 4000px
+OCR_MAX_SIDE = int(os.environ.get("OCR_MAX_SIDE", 2048))
+OCR_JPEG_QUALITY = int(os.environ.get("OCR_JPEG_QUALITY", 80))
+OCR_PREPROCESS = os.environ.get("OCR_PREPROCESS", "1") != "0"
+
+CROP_PADDING = 0.02  # Share of each side kept around the writing when the margins are cropped
+INK_CONTRAST = 48  # How much darker than its surroundings a pixel must be to count as writing
+HASH_SIZE = 32  # The perceptual hash has HASH_SIZE * HASH_SIZE bits
+
+
+def find_writing_box(image):
+    """Returns the (left, top, right, bottom) box around the writing on a grayscale page, or None."""
+    # Finding the box on a small copy is fast and averages away most paper texture
+    small = image.copy()
+    small.thumbnail((512, 512))
+    small = ImageOps.autocontrast(small, cutoff=1)
+    # Black-hat: strokes thinner than the filter are darker than the closed image, while the
+    # edge between the page and a darker desk is not, so the desk doesn't count as writing
+    closed = small.filter(ImageFilter.MaxFilter(5)).filter(ImageFilter.MinFilter(5))
+    ink = ImageChops.subtract(closed, small)
+    box = ink.point(lambda value: 255 if value > INK_CONTRAST else 0).getbbox()
+    if box is None:
+        return None
+
+    scale_x, scale_y = image.width / small.width, image.height / small.height
+    pad_x, pad_y = image.width * CROP_PADDING, image.height * CROP_PADDING
+    return (
+        max(0, int(box[0] * scale_x - pad_x)),
+        max(0, int(box[1] * scale_y - pad_y)),
+        min(image.width, int(box[2] * scale_x + pad_x)),
+        min(image.height, int(box[3] * scale_y + pad_y))
+    )
+
+
+def load_upright(image_bytes):
+    """Decodes a photo as an upright grayscale image."""
+    with Image.open(io.BytesIO(image_bytes)) as original:
+        # Lets the JPEG decoder skip detail that would be thrown away by the downscale anyway
+        original.draft('L', (OCR_MAX_SIDE, OCR_MAX_SIDE))
+        return ImageOps.exif_transpose(original).convert('L')
+
+
+def normalize_image(image):
+    """Crops an upright grayscale page to its writing and shrinks it to no more than OCR_MAX_SIDE."""
+    box = find_writing_box(image)
+    if box and box != (0, 0, image.width, image.height):
+        image = image.crop(box)
+    image.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+    return image
+
+
+def perceptual_hash(image):
+    """Returns the difference hash of an image as a hex string.
+
+    Each bit says whether a cell of a small grayscale copy is brighter than the
+    cell to its right, so a re-encoded or resized copy of the same photo gets
+    nearly the same hash. Pages with little writing on them also hash alike,
+    so a close hash is only a hint that two photos show the same page.
+    """
+    small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for y in range(HASH_SIZE):
+        row = pixels[y * (HASH_SIZE + 1):(y + 1) * (HASH_SIZE + 1)]
+        for x in range(HASH_SIZE):
+            bits = (bits << 1) | (row[x] > row[x + 1])
+    return f"{bits:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+
+def hash_distance(first, second):
+    """Number of bits that differ between two perceptual hashes."""
+    return bin(int(first, 16) ^ int(second, 16)).count('1')
+
+
+def prepare_image(image_bytes, filename):
+    """Shrinks a photo of a page before it is sent for OCR.
+
+    Turns it upright from its EXIF orientation, converts it to grayscale, crops
+    the empty margins around the writing, downscales it to OCR_MAX_SIDE and
+    re-encodes it as JPEG. Returns (image_bytes, filename, fingerprint), where
+    fingerprint is (perceptual_hash, aspect_ratio) of the whole upright page,
+    before cropping. The original bytes are returned when the image would not
+    get smaller, and the fingerprint is None when the image can't be decoded.
+    """
+    if Image is None or not OCR_PREPROCESS:
+        return image_bytes, filename, None
+    try:
+        image = load_upright(image_bytes)
+        # Hashed before cropping, since crops of pages with a few lines of writing all look alike
+        fingerprint = (perceptual_hash(image), round(image.width / image.height, 4))
+        image = normalize_image(image)
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=OCR_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        print(f"Image preprocessing skipped for {filename}: {e}")
+        return image_bytes, filename, None
+
+    prepared = output.getvalue()
+    if len(prepared) >= len(image_bytes):
+        return image_bytes, filename, fingerprint
+    print(f"Preprocessed {filename}: {len(image_bytes)} -> {len(prepared)} bytes, {image.width}x{image.height}")
+    return prepared, os.path.splitext(filename)[0] + ".jpg", fingerprint
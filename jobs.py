@@ -0,0 +1,243 @@
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+from sqlite_store import SqliteStore
+
+
+class JobQueue(SqliteStore):
+    """Persistent job queue in an SQLite file, shared by the web and worker processes.
+
+    A worker claims a job by taking a lease on it and renews the lease while the
+    job runs. If the worker dies before it finishes, the lease runs out and
+    another worker picks the job up again, up to max_attempts times. Each claim
+    is one attempt, and only the attempt holding the job can finish it.
+    """
+
+    row_factory = sqlite3.Row
+
+    def __init__(self, path, lease_seconds=300.0, max_attempts=3):
+        super().__init__(path, (
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT NOT NULL, result TEXT, error TEXT, progress TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, lease_expires_at REAL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)",
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, "
+            "event TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, seq)",
+        ))
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def enqueue(self, kind, payload):
+        """Adds a job and returns its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), now, now)
+            )
+        return job_id
+
+    def claim(self):
+        """Takes the oldest runnable job, including ones whose worker died, or returns None."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE attempts < ? AND "
+                "(status = 'queued' OR (status = 'running' AND lease_expires_at < ?)) "
+                "ORDER BY created_at LIMIT 1",
+                (self.max_attempts, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                    "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                    (now + self.lease_seconds, now, row['id'])
+                )
+            # Jobs whose worker died on the last allowed attempt will never be claimed again
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped while running the job', "
+                "updated_at = ? WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE status = 'failed')"
+            )
+        if row is None:
+            return None
+        return {'id': row['id'], 'kind': row['kind'], 'payload': json.loads(row['payload']),
+                'attempts': row['attempts'] + 1}
+
+    def renew(self, job_id, attempt):
+        """Extends the lease of a running attempt. Returns False if the attempt no longer holds the job."""
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND attempts = ? AND status = 'running'",
+                (now + self.lease_seconds, now, job_id, attempt)
+            ).rowcount
+        return updated == 1
+
+    def complete(self, job_id, result, attempt):
+        """Stores the result of an attempt. Returns False, storing nothing, if another attempt took over."""
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_expires_at = NULL, "
+                "updated_at = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+                (json.dumps(result), time.time(), job_id, attempt)
+            ).rowcount
+            if updated:
+                self._clear_events(conn, job_id)
+        return updated == 1
+
+    def fail(self, job_id, error, attempt):
+        """Records a failed attempt, putting the job back in the queue if it has attempts left.
+
+        Returns False, recording nothing, if another attempt took over.
+        """
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                "error = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND attempts = ? AND status = 'running'",
+                (self.max_attempts, str(error), time.time(), job_id, attempt)
+            ).rowcount
+            if updated:
+                self._clear_events(conn, job_id)
+        return updated == 1
+
+    def _clear_events(self, conn, job_id):
+        # Once an attempt is over its partial results are in the job record or stale, and a
+        # job streams many of them, so they are not kept
+        conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+
+    def retry(self, job_id, statuses=('failed',)):
+        """Puts a job in one of statuses back in the queue with a fresh set of attempts."""
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, updated_at = ? "
+                f"WHERE id = ? AND status IN ({', '.join('?' * len(statuses))})",
+                (time.time(), job_id, *statuses)
+            ).rowcount
+        return updated == 1
+
+    def set_progress(self, job_id, progress, attempt):
+        """Stores how far a running attempt has got, e.g. {"done": 12, "total": 40}."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+                (json.dumps(progress), time.time(), job_id, attempt)
+            )
+
+    def add_event(self, job_id, event, data, attempt):
+        """Records a partial result of a running attempt so the web process can stream it.
+
+        Does nothing once the attempt has ended, since its events were cleared then and
+        nothing would clear them again. Returns whether the event was recorded.
+        """
+        with self._connect() as conn:
+            inserted = conn.execute(
+                "INSERT INTO job_events (job_id, event, data, created_at) SELECT ?, ?, ?, ? "
+                "WHERE EXISTS (SELECT 1 FROM jobs WHERE id = ? AND attempts = ? AND status = 'running')",
+                (job_id, event, json.dumps(data), time.time(), job_id, attempt)
+            ).rowcount
+        return inserted == 1
+
+    def events_since(self, job_id, after_seq=0):
+        """Returns the job's events newer than after_seq as (seq, event, data) tuples."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after_seq)
+            ).fetchall()
+        return [(row['seq'], row['event'], json.loads(row['data'])) for row in rows]
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if there is no such job."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'payload': json.loads(row['payload']),
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'progress': json.loads(row['progress']) if row['progress'] else None,
+            'attempts': row['attempts'],
+        }
+
+    def counts(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+def run_worker(queue, handlers, stop_event=None, poll_interval=1.0):
+    """Claims and runs jobs until stop_event is set.
+
+    handlers maps a job kind to a function(payload, report), where report(event, data)
+    publishes a partial result of the job. A 'progress' event is also stored on the
+    job record itself.
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        job = queue.claim()
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        print(f"Running job {job['id']} ({job['kind']}), attempt {job['attempts']}")
+
+        def report(event, data, job_id=job['id'], attempt=job['attempts']):
+            # A stage still running after a timeout may report after the attempt has ended
+            if event == 'progress':
+                queue.set_progress(job_id, data, attempt)
+            queue.add_event(job_id, event, data, attempt)
+
+        # Renews the lease a few times per lease period, so a long job isn't claimed again while it runs
+        finished = threading.Event()
+
+        def heartbeat(job_id=job['id'], attempt=job['attempts']):
+            while not finished.wait(queue.lease_seconds / 3):
+                if not queue.renew(job_id, attempt):
+                    print(f"Job {job_id} attempt {attempt} lost its lease")
+                    return
+
+        heartbeat_thread = threading.Thread(target=heartbeat, name=f"job-heartbeat-{job['id']}", daemon=True)
+        heartbeat_thread.start()
+        try:
+            result = handlers[job['kind']](job['payload'], report)
+        except Exception as e:
+            print(f"Job {job['id']} failed: {e}")
+            finished.set()
+            queue.fail(job['id'], e, job['attempts'])
+        else:
+            finished.set()
+            if queue.complete(job['id'], result, job['attempts']):
+                print(f"Job {job['id']} done")
+            else:
+                print(f"Job {job['id']} attempt {job['attempts']} finished after another attempt took over")
+        heartbeat_thread.join()
+
+
+def start_workers(queue, handlers, count, stop_event=None):
+    """Starts count daemon threads running run_worker and returns them."""
+    threads = []
+    for i in range(count):
+        thread = threading.Thread(
+            target=run_worker, args=(queue, handlers, stop_event), name=f"job-worker-{i + 1}", daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    return threads
@@ -0,0 +1,113 @@
+import time
+import threading
+
+from rate_limit import RateLimitTimeout, key_fingerprint
+from retry import classify_error, is_rate_limit_error
+
+
+class ApiKey:
+    """One API key, its client and the counters used to pick the least-loaded key."""
+
+    def __init__(self, api_key, client):
+        self.api_key = api_key
+        self.fingerprint = key_fingerprint(api_key)
+        self.client = client
+        self.in_flight = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.latency = None  # Moving average in seconds
+        self.cooldown_until = 0.0
+
+    def is_healthy(self, now):
+        return now >= self.cooldown_until
+
+    def stats(self, now):
+        return {
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'errors': self.errors,
+            'avg_latency': round(self.latency, 3) if self.latency is not None else None,
+            'cooling_down_for': round(max(0.0, self.cooldown_until - now), 1),
+        }
+
+
+class KeyPool:
+    """Spreads provider calls over several API keys.
+
+    Each call goes to the healthy key with the fewest requests in flight, then the
+    fewest requests overall. A key that gets rate limited cools down for the
+    provider's Retry-After hint, or for `cooldown` seconds when there is none.
+    """
+
+    def __init__(self, api_keys, client_factory, cooldown=60.0, latency_weight=0.2):
+        if not api_keys:
+            raise ValueError("The key pool needs at least one API key.")
+        self.keys = [ApiKey(api_key, client_factory(api_key)) for api_key in api_keys]
+        self.cooldown = cooldown
+        self.latency_weight = latency_weight
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Leases the least-loaded healthy key. Call release() with the outcome when done."""
+        with self._lock:
+            now = time.time()
+            healthy = [key for key in self.keys if key.is_healthy(now)]
+            if healthy:
+                key = min(healthy, key=lambda k: (k.in_flight, k.requests))
+            else:
+                # Every key is cooling down, so use the one that comes back first
+                key = min(self.keys, key=lambda k: k.cooldown_until)
+            key.in_flight += 1
+            key.requests += 1
+            return key
+
+    def cancel(self, key):
+        """Returns a leased key whose request was never sent, as if it had not been leased."""
+        with self._lock:
+            key.in_flight -= 1
+            key.requests -= 1
+
+    def release(self, key, latency=None, error=None):
+        with self._lock:
+            key.in_flight -= 1
+            if error is None:
+                if latency is not None:
+                    key.latency = latency if key.latency is None else (
+                        self.latency_weight * latency + (1 - self.latency_weight) * key.latency
+                    )
+                return
+            if is_rate_limit_error(error):
+                _, retry_after = classify_error(error)
+                key.rate_limited += 1
+                key.cooldown_until = time.time() + (retry_after if retry_after is not None else self.cooldown)
+                print(f"API key {key.fingerprint} rate limited, cooling down")
+            else:
+                key.errors += 1
+
+    def call(self, func, before=None):
+        """Runs func(key) on a leased key and records the outcome.
+
+        before(key), if given, runs first and isn't counted in the key's latency, e.g. waiting for a rate limit slot.
+        """
+        key = self.acquire()
+        try:
+            if before:
+                before(key)
+            start = time.perf_counter()
+            result = func(key)
+        except RateLimitTimeout:
+            # Our own limiter gave up before the request was sent, so the key did nothing wrong
+            self.cancel(key)
+            raise
+        except Exception as e:
+            self.release(key, error=e)
+            raise
+        self.release(key, latency=time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return {key.fingerprint: key.stats(now) for key in self.keys}
@@ -1,4 +1,10 @@
-from app import app  # Import the Flask app object from app.py
+import os
+from app import app, job_queue, JOB_HANDLERS  # Import the Flask app object from app.py
+from jobs import start_workers
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    # The dev server runs the grading jobs itself instead of needing worker.py alongside it.
+    # With debug on, the reloader re-runs this file in a child process, which is the one serving requests.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_workers(job_queue, JOB_HANDLERS, int(os.environ.get("JOB_WORKERS", 2)))
+    app.run(debug=True)
@@ -0,0 +1,138 @@
+import time
+import sqlite3
+
+from image_prep import hash_distance
+from sqlite_store import SqliteStore
+
+
+class OcrCache(SqliteStore):
+    """Text extracted from images, stored in an SQLite file shared by every worker.
+
+    An upload is looked up by the SHA-256 of the bytes as uploaded, then by the
+    SHA-256 of the normalized image (upright, grayscale, cropped and downscaled).
+    With max_distance set, a photo whose perceptual hash and shape are close to
+    an earlier one's also counts, which catches re-encoded or resized copies but
+    can mistake two pages with little writing for each other, so it is off
+    unless configured. Every entry belongs to an OCR prompt version, so a new
+    prompt starts afresh.
+    """
+
+    def __init__(self, path, max_entries=4096, ttl=30 * 24 * 3600, max_distance=None):
+        super().__init__(path, (
+            "CREATE TABLE IF NOT EXISTS ocr_texts ("
+            "upload_sha256 TEXT NOT NULL, version INTEGER NOT NULL, sha256 TEXT NOT NULL, phash TEXT, "
+            "aspect REAL, text TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (upload_sha256, version))",
+            "CREATE INDEX IF NOT EXISTS ocr_texts_sha256 ON ocr_texts (sha256, version)",
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        ))
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+
+    def _count(self, name):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO counters (name, value) VALUES (?, 1) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                    (name,)
+                )
+        except sqlite3.Error as e:
+            print(f"OCR cache counter update failed: {e}")
+
+    def get_upload(self, upload_sha256, version, count=True):
+        """Returns the text of an upload whose exact bytes were seen before, or None.
+
+        count=False only checks, without counting a hit, e.g. before the text is actually used.
+        """
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT text FROM ocr_texts WHERE upload_sha256 = ? AND version = ? AND created_at >= ?",
+                    (upload_sha256, version, time.time() - self.ttl)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"OCR cache read failed: {e}")
+            return None
+        if row is not None and count:
+            self._count('upload_hits')
+        return row and row[0]
+
+    def get_image(self, sha256, version):
+        """Returns the text of an upload whose normalized image is exactly the same, or None."""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT text FROM ocr_texts WHERE sha256 = ? AND version = ? AND created_at >= ?",
+                    (sha256, version, time.time() - self.ttl)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"OCR cache read failed: {e}")
+            return None
+        if row is not None:
+            self._count('image_hits')
+        return row and row[0]
+
+    def get_similar(self, fingerprint, version):
+        """Returns the text of a photo with the same shape and a perceptual hash within max_distance, or None.
+
+        The match is a guess, so callers should not store its text under the new upload.
+        Counts a miss when nothing is found, since this is the last lookup before the provider is called.
+        """
+        if self.max_distance is None or fingerprint is None:
+            self._count('misses')
+            return None
+        phash, aspect = fingerprint
+        try:
+            with self._connect() as conn:
+                # A photo of the same page, re-encoded or resized, keeps its shape
+                candidates = conn.execute(
+                    "SELECT phash, text FROM ocr_texts WHERE phash IS NOT NULL AND version = ? "
+                    "AND created_at >= ? AND aspect BETWEEN ? AND ?",
+                    (version, time.time() - self.ttl, aspect * 0.99, aspect * 1.01)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"OCR cache read failed: {e}")
+            return None
+
+        best = min(candidates, key=lambda candidate: hash_distance(phash, candidate[0]), default=None)
+        if best is not None and hash_distance(phash, best[0]) <= self.max_distance:
+            self._count('similar_hits')
+            return best[1]
+        self._count('misses')
+        return None
+
+    def set(self, upload_sha256, sha256, fingerprint, version, text):
+        """Stores the text of an upload and drops expired entries and the oldest ones beyond max_entries."""
+        phash, aspect = fingerprint or (None, None)
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ocr_texts (upload_sha256, version, sha256, phash, aspect, text, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (upload_sha256, version, sha256, phash, aspect, text, now)
+                )
+                conn.execute("DELETE FROM ocr_texts WHERE created_at < ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM ocr_texts WHERE rowid NOT IN "
+                    "(SELECT rowid FROM ocr_texts ORDER BY created_at DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            print(f"OCR cache write failed: {e}")
+
+    def stats(self):
+        """Returns the lookup counters of all workers combined."""
+        counters = {'upload_hits': 0, 'image_hits': 0, 'similar_hits': 0, 'misses': 0}
+        try:
+            with self._connect() as conn:
+                counters.update(dict(conn.execute("SELECT name, value FROM counters").fetchall()))
+                counters['entries'] = conn.execute("SELECT COUNT(*) FROM ocr_texts").fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"OCR cache stats read failed: {e}")
+
+        hits = counters['upload_hits'] + counters['image_hits'] + counters['similar_hits']
+        lookups = hits + counters['misses']
+        counters['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+        return counters
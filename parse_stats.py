@@ -0,0 +1,50 @@
+import sqlite3
+
+from sqlite_store import SqliteStore
+
+OUTCOMES = ('valid', 'corrected', 'failed')
+
+
+class ParseStats(SqliteStore):
+    """Counts, per model, how often its replies follow the requested grade format.
+
+    Each reply is recorded once as 'valid' (right the first time), 'corrected'
+    (right after a corrective follow-up) or 'failed' (still wrong after it).
+    The counts live in an SQLite file so every worker process adds to them.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, (
+            "CREATE TABLE IF NOT EXISTS parse_outcomes ("
+            "model TEXT NOT NULL, kind TEXT NOT NULL, outcome TEXT NOT NULL, "
+            "count INTEGER NOT NULL, PRIMARY KEY (model, kind, outcome))",
+        ))
+
+    def record(self, model, kind, outcome):
+        """Adds one reply of the given kind ('grade' or 'rubric') to the model's counts."""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO parse_outcomes (model, kind, outcome, count) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT(model, kind, outcome) DO UPDATE SET count = count + 1",
+                    (model or "default", kind, outcome)
+                )
+        except sqlite3.Error as e:
+            print(f"Parse stats update failed: {e}")
+
+    def stats(self):
+        """Returns {model: {kind: counts and parse_failure_rate}}."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT model, kind, outcome, count FROM parse_outcomes").fetchall()
+
+        stats = {}
+        for model, kind, outcome, count in rows:
+            counts = stats.setdefault(model, {}).setdefault(kind, dict.fromkeys(OUTCOMES, 0))
+            counts[outcome] = count
+        for kinds in stats.values():
+            for counts in kinds.values():
+                replies = sum(counts[outcome] for outcome in OUTCOMES)
+                counts['replies'] = replies
+                # Share of replies that were not usable as first sent
+                counts['parse_failure_rate'] = round((counts['corrected'] + counts['failed']) / replies, 3)
+        return stats
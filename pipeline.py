@@ -0,0 +1,157 @@
+import time
+import queue
+import threading
+
+_DONE = object()  # Tells a stage worker there is no more input
+
+
+class Stage:
+    """One step of a Pipeline: func(index, item) run by `workers` threads at a time."""
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.idle_seconds = 0.0  # Waiting for input from the previous stage
+        self.blocked_seconds = 0.0  # Waiting for room in the next stage's queue
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def _record(self, start, end, failed):
+        with self._lock:
+            self.processed += 1
+            self.failed += failed
+            self.busy_seconds += end - start
+            self.first_start = start if self.first_start is None else min(self.first_start, start)
+            self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+    def stats(self):
+        with self._lock:
+            active = (self.last_end - self.first_start) if self.processed else 0.0
+            return {
+                'workers': self.workers,
+                'processed': self.processed,
+                'failed': self.failed,
+                'active_seconds': round(active, 2),
+                'throughput_per_minute': round(self.processed / active * 60, 2) if active > 0 else None,
+                'avg_seconds': round(self.busy_seconds / self.processed, 2) if self.processed else None,
+                # Close to 1 means the stage is the bottleneck and could use more workers
+                'utilization': round(self.busy_seconds / (active * self.workers), 2) if active > 0 else None,
+                'idle_seconds': round(self.idle_seconds, 2),
+                'blocked_seconds': round(self.blocked_seconds, 2),
+            }
+
+
+class Pipeline:
+    """Runs items through stages that overlap, like an assembly line.
+
+    Each stage has its own worker threads and reads from a bounded queue, so
+    while one item is in a later stage the next ones are already in earlier
+    stages, and a slow stage holds the earlier ones back instead of letting
+    work pile up in memory.
+
+    Whatever a stage returns is passed to the next stage. If a stage raises,
+    on_error(index, item, stage_name, error) gives the item's final result and
+    the remaining stages are skipped for it. If on_error or on_result raises,
+    the exception becomes the item's result and the other items carry on.
+    """
+
+    def __init__(self, stages, queue_size=4, on_error=None):
+        if not stages:
+            raise ValueError("The pipeline needs at least one stage.")
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.on_error = on_error or (lambda index, item, stage_name, error: error)
+
+    def run(self, items, on_result=None):
+        """Runs every item through the stages and returns the results in input order.
+
+        on_result(index, result) is called as soon as each item leaves the pipeline.
+        """
+        items = list(items)
+        results = [None] * len(items)
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining_workers = [stage.workers for stage in self.stages]
+        lock = threading.Lock()
+
+        def finish(index, result):
+            results[index] = result
+            if on_result:
+                # A worker that dies here would leave the earlier stage blocked on a full queue
+                try:
+                    on_result(index, result)
+                except Exception as e:
+                    print(f"Pipeline on_result failed on item {index}: {e}")
+                    results[index] = e
+
+        def put_next(stage, position, entry):
+            start = time.perf_counter()
+            queues[position + 1].put(entry)
+            with stage._lock:
+                stage.blocked_seconds += time.perf_counter() - start
+
+        def work(position):
+            stage = self.stages[position]
+            is_last = position == len(self.stages) - 1
+            try:
+                while True:
+                    wait_start = time.perf_counter()
+                    entry = queues[position].get()
+                    with stage._lock:
+                        stage.idle_seconds += time.perf_counter() - wait_start
+                    if entry is _DONE:
+                        break
+
+                    index, item = entry
+                    start = time.perf_counter()
+                    try:
+                        output = stage.func(index, item)
+                    except Exception as e:
+                        stage._record(start, time.perf_counter(), failed=1)
+                        print(f"Pipeline stage {stage.name} failed on item {index}: {e}")
+                        try:
+                            result = self.on_error(index, item, stage.name, e)
+                        except Exception as callback_error:
+                            print(f"Pipeline on_error failed on item {index}: {callback_error}")
+                            result = callback_error
+                        finish(index, result)
+                        continue
+                    stage._record(start, time.perf_counter(), failed=0)
+
+                    if is_last:
+                        finish(index, output)
+                    else:
+                        put_next(stage, position, (index, output))
+            finally:
+                # The last worker of a stage to finish tells every worker of the next stage to stop
+                with lock:
+                    remaining_workers[position] -= 1
+                    last_worker = remaining_workers[position] == 0
+                if last_worker and not is_last:
+                    for _ in range(self.stages[position + 1].workers):
+                        queues[position + 1].put(_DONE)
+
+        threads = [
+            threading.Thread(target=work, args=(position,), name=f"pipeline-{stage.name}-{i + 1}", daemon=True)
+            for position, stage in enumerate(self.stages)
+            for i in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # Feeding the first queue blocks while it is full, which is the backpressure on the input
+        for index, item in enumerate(items):
+            queues[0].put((index, item))
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_DONE)
+
+        for thread in threads:
+            thread.join()
+        return results
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
@@ -0,0 +1,226 @@
+import os
+import time
+import threading
+from collections import deque
+
+import g4f
+import g4f.Provider
+
+from key_pool import KeyPool
+from rate_limit import RateLimitTimeout
+
+
+class NoHealthyRouteError(Exception):
+    """Raised when every provider route has its circuit breaker open."""
+
+
+class CircuitBreaker:
+    """Stops sending traffic to a route after repeated failures.
+
+    closed: calls flow normally. open: calls are refused until reset_timeout has
+    passed. half_open: one trial call is let through; success closes the
+    breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def allows(self, now):
+        if self.state == 'open' and now - self.opened_at >= self.reset_timeout:
+            self.state = 'half_open'
+            self.trial_in_flight = False
+        if self.state == 'half_open':
+            return not self.trial_in_flight
+        return self.state == 'closed'
+
+    def on_start(self):
+        if self.state == 'half_open':
+            self.trial_in_flight = True
+
+    def on_cancel(self):
+        """The call never reached the route, so a half-open breaker may let another trial through."""
+        self.trial_in_flight = False
+
+    def on_success(self):
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+
+    def on_failure(self, now):
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.state == 'half_open' or self.consecutive_failures >= self.failure_threshold:
+            self.state = 'open'
+            self.opened_at = now
+
+
+class Route:
+    """A provider and model pair with its own key pool, health averages and breaker."""
+
+    def __init__(self, provider_name, model, key_pool, breaker):
+        self.provider_name = provider_name
+        self.model = model
+        self.key_pool = key_pool
+        self.breaker = breaker
+        self.latency = None  # Moving average in seconds
+        self.error_rate = 0.0  # Moving average of failures (0 to 1)
+        self.calls = 0
+        self.failures = 0
+
+    @property
+    def name(self):
+        return f"{self.provider_name}/{self.model or 'default'}"
+
+    def score(self, default_latency):
+        # Lower is better. Routes without a latency sample yet are assumed to be as fast as the best one.
+        latency = self.latency if self.latency is not None else default_latency
+        return latency * (1 + 4 * self.error_rate)
+
+    def stats(self):
+        return {
+            'breaker': self.breaker.state,
+            'consecutive_failures': self.breaker.consecutive_failures,
+            'avg_latency': round(self.latency, 3) if self.latency is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'calls': self.calls,
+            'failures': self.failures,
+            'keys': self.key_pool.stats(),
+        }
+
+
+class ProviderRouter:
+    """Sends each call to the best healthy route and fails over to the next one on errors.
+
+    Routes are kept in their configured order, which breaks ties between routes
+    with equal scores.
+    """
+
+    def __init__(self, routes, weight=0.2, history=50):
+        if not routes:
+            raise ValueError("The router needs at least one route.")
+        self.routes = routes
+        self.weight = weight
+        self.decisions = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def ranked(self):
+        """Returns the routes whose breaker lets a call through, best first."""
+        with self._lock:
+            now = time.time()
+            healthy = [route for route in self.routes if route.breaker.allows(now)]
+            known = [route.latency for route in self.routes if route.latency is not None]
+            default_latency = min(known) if known else 0.0
+            # sorted() is stable, so equal routes keep their configured order
+            return sorted(healthy, key=lambda route: (route.score(default_latency), route.error_rate))
+
+    def _record(self, route, latency=None, error=None):
+        with self._lock:
+            now = time.time()
+            route.calls += 1
+            previous_state = route.breaker.state
+            if error is None:
+                route.breaker.on_success()
+                route.latency = latency if route.latency is None else (
+                    self.weight * latency + (1 - self.weight) * route.latency
+                )
+                route.error_rate = (1 - self.weight) * route.error_rate
+            else:
+                route.failures += 1
+                route.breaker.on_failure(now)
+                route.error_rate = self.weight + (1 - self.weight) * route.error_rate
+            if route.breaker.state != previous_state:
+                print(f"Circuit breaker for {route.name}: {previous_state} -> {route.breaker.state}")
+
+    def call(self, func, avoid_best=False, before=None):
+        """Runs func(key, route) on the best healthy route, failing over to the next on error.
+
+        avoid_best starts from the second-best route, so a hedged duplicate goes
+        to a different provider than the original request when there is one.
+        before(key, route), if given, runs ahead of each attempt and isn't counted
+        in the route's latency, e.g. waiting for a rate limit slot.
+        """
+        candidates = self.ranked()
+        if not candidates:
+            raise NoHealthyRouteError("Every provider route is unavailable, try again later.")
+        if avoid_best and len(candidates) > 1:
+            candidates = candidates[1:] + candidates[:1]
+
+        last_error = None
+        for route in candidates:
+            with self._lock:
+                if not route.breaker.allows(time.time()):
+                    continue
+                route.breaker.on_start()
+            self.decisions.append({
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'route': route.name,
+                'failover_from': last_error and str(last_error)[:200],
+                'hedge': avoid_best,
+            })
+            sent_at = []
+
+            def send(key, route=route):
+                sent_at.append(time.perf_counter())
+                return func(key, route)
+
+            try:
+                result = route.key_pool.call(send, before=before and (lambda key, route=route: before(key, route)))
+            except RateLimitTimeout:
+                # The local rate limiter timed out before anything was sent; that says nothing about the route
+                with self._lock:
+                    route.breaker.on_cancel()
+                raise
+            except Exception as e:
+                self._record(route, error=e)
+                print(f"Route {route.name} failed: {e}")
+                last_error = e
+                continue
+            self._record(route, latency=time.perf_counter() - sent_at[0])
+            return result
+
+        raise last_error or NoHealthyRouteError("Every provider route is unavailable, try again later.")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'routes': {route.name: route.stats() for route in self.routes},
+                'recent_decisions': list(self.decisions),
+            }
+
+
+def build_router(route_configs, default_api_keys, key_cooldown=60.0,
+                 failure_threshold=5, reset_timeout=30.0):
+    """Builds a router from route configs like {"provider": "GeminiPro", "model": "...", "api_keys_env": "..."}.
+
+    Routes without api_keys_env use default_api_keys when they are GeminiPro
+    routes, and no key otherwise.
+    """
+    routes = []
+    for config in route_configs:
+        provider_name = config['provider']
+        provider = getattr(g4f.Provider, provider_name)
+
+        if config.get('api_keys_env'):
+            api_keys = [key.strip() for key in os.environ.get(config['api_keys_env'], "").split(",") if key.strip()]
+        elif provider_name == "GeminiPro":
+            api_keys = default_api_keys
+        else:
+            api_keys = [""]
+
+        key_pool = KeyPool(
+            api_keys,
+            client_factory=lambda api_key, provider=provider: g4f.Client(provider=provider, api_key=api_key or None),
+            cooldown=key_cooldown
+        )
+        routes.append(Route(
+            provider_name,
+            config.get('model', ""),
+            key_pool,
+            CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        ))
+    return ProviderRouter(routes)
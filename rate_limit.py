@@ -0,0 +1,85 @@
+import time
+import hashlib
+
+from sqlite_store import SqliteStore
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a caller would have to wait longer than max_wait for a slot."""
+
+
+def key_fingerprint(api_key):
+    """Short, non-reversible label for an API key, safe to use in logs and config."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+
+
+class SharedRateLimiter(SqliteStore):
+    """Token buckets shared by every process on the machine through an SQLite file.
+
+    There is one bucket per (model, API key). Limits are looked up as
+    "<model>:<key fingerprint>", then "<model>", then "default", each given as
+    {"rate": requests per second, "capacity": burst size}. Models with none of
+    these are not limited.
+
+    A caller takes its token straight away, even if that leaves the bucket in
+    debt, and then sleeps until the debt is repaid. Callers are served in
+    arrival order, and nobody fires a request the provider would reject.
+    """
+
+    def __init__(self, path, limits=None, max_wait=60.0):
+        super().__init__(path, (
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)",
+        ))
+        self.limits = limits or {}
+        self.max_wait = max_wait
+
+    def _limit_for(self, model, fingerprint):
+        return (
+            self.limits.get(f"{model}:{fingerprint}")
+            or self.limits.get(model)
+            or self.limits.get("default")
+        )
+
+    def _reserve(self, name, rate, capacity):
+        """Takes one token from the bucket and returns how long to wait before using it."""
+        with self._transaction() as conn:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            wait_time = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if wait_time <= self.max_wait:
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                    (name, tokens - 1, now)
+                )
+        return wait_time
+
+    def acquire(self, model, api_key):
+        """Blocks until the (model, API key) bucket has a slot for one request."""
+        model = model or "default"
+        fingerprint = key_fingerprint(api_key)
+        limit = self._limit_for(model, fingerprint)
+        if limit is None:
+            return
+        name = f"{model}:{fingerprint}"
+        wait_time = self._reserve(name, limit['rate'], limit['capacity'])
+        if wait_time > self.max_wait:
+            raise RateLimitTimeout(f"No slot for {name} within {self.max_wait:g} seconds")
+        if wait_time > 0:
+            print(f"Rate limiter: waiting {wait_time:.2f}s for a slot on {name}")
+            time.sleep(wait_time)
+
+    def stats(self):
+        """Returns the current token count of every bucket."""
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name, tokens, updated_at FROM buckets").fetchall()
+        stats = {}
+        for name, tokens, updated_at in rows:
+            model, _, fingerprint = name.rpartition(':')
+            limit = self._limit_for(model, fingerprint)
+            if limit is None:  # The limit was removed from the config since the bucket was used
+                continue
+            stats[name] = round(min(limit['capacity'], tokens + (now - updated_at) * limit['rate']), 2)
+        return stats
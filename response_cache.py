@@ -0,0 +1,190 @@
+import json
+import atexit
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from sqlite_store import SqliteStore
+
+
+def make_key(*parts):
+    """Builds a content-addressed cache key from the parts that decide a response."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache(SqliteStore):
+    """Two-tier cache for provider responses.
+
+    The first tier is an in-process LRU with a TTL. The second tier is an SQLite
+    file on disk, so every gunicorn worker on the machine shares it, holding at
+    most max_disk_entries rows. Values must be JSON serializable.
+
+    Hit and miss counters are kept in memory and added to the shared totals on
+    disk at most every flush_interval seconds, so a memory hit never touches the
+    disk. Expired and excess disk rows are pruned on the same schedule.
+    """
+
+    def __init__(self, path, max_entries=1024, ttl=7 * 24 * 3600, max_disk_entries=50000, flush_interval=10.0):
+        super().__init__(path, (
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)",
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        ))
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.flush_interval = flush_interval
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self._unflushed = dict.fromkeys(self._counters, 0)
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+            self._unflushed[name] += amount
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            if due:
+                self._last_flush = time.monotonic()
+        if due:
+            self.flush()
+            self.prune()
+
+    def flush(self):
+        """Adds the counters of this process since the last flush to the totals shared by all workers."""
+        with self._lock:
+            unflushed = [(name, amount) for name, amount in self._unflushed.items() if amount]
+            self._unflushed = dict.fromkeys(self._counters, 0)
+        if not unflushed:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    unflushed
+                )
+        except sqlite3.Error as e:
+            print(f"Cache counter update failed: {e}")
+
+    def _remember(self, key, value, created_at):
+        evicted = 0
+        with self._lock:
+            self._memory[key] = (value, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._count('evictions', evicted)
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss."""
+        now = time.time()
+
+        expired = False
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                else:
+                    del self._memory[key]
+                    entry = None
+                    expired = True
+        if entry is not None:
+            self._count('memory_hits')
+            return value
+        if expired:
+            self._count('evictions')
+            expired = False
+
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    expired = True
+                    row = None
+        except sqlite3.Error as e:
+            print(f"Cache read failed: {e}")
+            row = None
+        if expired:
+            self._count('evictions')
+
+        if row is None:
+            self._count('misses')
+            return None
+
+        value = json.loads(row[0])
+        self._remember(key, value, row[1])
+        self._count('disk_hits')
+        return value
+
+    def set(self, key, value):
+        """Stores value under key in both tiers."""
+        created_at = time.time()
+        self._remember(key, value, created_at)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), created_at)
+                )
+        except sqlite3.Error as e:
+            print(f"Cache write failed: {e}")
+
+    def prune(self):
+        """Deletes expired entries and the oldest ones beyond max_disk_entries from the disk tier.
+
+        Returns how many were removed.
+        """
+        try:
+            with self._transaction() as conn:
+                removed = conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+                ).rowcount
+                removed += conn.execute(
+                    "DELETE FROM responses WHERE created_at < (SELECT created_at FROM responses "
+                    "ORDER BY created_at DESC LIMIT 1 OFFSET ?)",
+                    (self.max_disk_entries - 1,)
+                ).rowcount
+        except sqlite3.Error as e:
+            print(f"Cache prune failed: {e}")
+            return 0
+        if removed:
+            with self._lock:
+                self._counters['evictions'] += removed
+                self._unflushed['evictions'] += removed
+        return removed
+
+    def stats(self):
+        """Returns the hit/miss/eviction counters for this process and for all workers combined."""
+        self.flush()
+        with self._lock:
+            process = dict(self._counters)
+            process['memory_entries'] = len(self._memory)
+
+        shared = {name: 0 for name in self._counters}
+        try:
+            with self._connect() as conn:
+                shared.update(dict(conn.execute("SELECT name, value FROM counters").fetchall()))
+                shared['disk_entries'] = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Cache stats read failed: {e}")
+
+        for counters in (process, shared):
+            hits = counters['memory_hits'] + counters['disk_hits']
+            lookups = hits + counters['misses']
+            counters['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+
+        return {'process': process, 'all_workers': shared}
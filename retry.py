@@ -0,0 +1,186 @@
+import re
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+from aiohttp import ClientResponseError
+from g4f.errors import RateLimitError, ResponseStatusError
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+status_pattern = re.compile(r"\b(429|5\d\d)\b")
+retry_after_pattern = re.compile(r"retry(?:[\s_-]*after|\s+in)[\s:]*(\d+(?:\.\d+)?)\s*(ms|s|sec|seconds?)?", re.IGNORECASE)
+
+
+class RetryBudgetExceeded(Exception):
+    """Raised when a call fails and the process has no retries left in its budget."""
+
+
+class RetryBudget:
+    """Limits retries to a fraction of recent calls so an outage can't turn into a retry storm.
+
+    Every first attempt in the last `window` seconds allows `ratio` retries, on top
+    of `min_retries` that are always allowed in the window.
+    """
+
+    def __init__(self, ratio=0.2, min_retries=10, window=60.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._calls = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        for events in (self._calls, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_call(self):
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._calls.append(now)
+
+    def try_spend(self):
+        """Takes one retry out of the budget, returning False if none are left."""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._calls):
+                return False
+            self._retries.append(now)
+            return True
+
+    def stats(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            return {'calls': len(self._calls), 'retries': len(self._retries)}
+
+
+class RetryPolicy:
+    """How often and how long to wait between attempts of a provider call."""
+
+    def __init__(self, max_retries=3, base_delay=1.0, max_delay=30.0, deadline=90.0, budget=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.budget = budget or RetryBudget()
+
+    def next_delay(self, previous_delay, retry_after=None):
+        """Decorrelated jitter, never shorter than the provider's Retry-After hint."""
+        delay = min(self.max_delay, random.uniform(self.base_delay, max(self.base_delay, previous_delay * 3)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+def parse_retry_after(value):
+    """Converts a Retry-After value (seconds or an HTTP date) to seconds, or None."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """Returns (retryable, retry_after_seconds) for an exception raised by a provider call."""
+    retry_after = None
+    headers = getattr(error, 'headers', None)
+    if headers:
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+    if retry_after is None:
+        match = retry_after_pattern.search(str(error))
+        if match:
+            retry_after = float(match.group(1))
+            if (match.group(2) or '').lower() == 'ms':
+                retry_after /= 1000
+
+    if isinstance(error, RateLimitError):
+        return True, retry_after
+    if isinstance(error, ClientResponseError):
+        return error.status in RETRYABLE_STATUSES, retry_after
+    if isinstance(error, ResponseStatusError):
+        # g4f puts the HTTP status in the message, e.g. "Response 503: ..."
+        return bool(status_pattern.search(str(error))), retry_after
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True, retry_after
+    return False, None
+
+
+def is_rate_limit_error(error):
+    """True if the provider rejected the call because a quota or rate limit was hit."""
+    if isinstance(error, RateLimitError):
+        return True
+    if isinstance(error, ClientResponseError):
+        return error.status == 429
+    if isinstance(error, ResponseStatusError):
+        return "429" in str(error)
+    return False
+
+
+def _plan_retry(error, attempt, delay, started, policy):
+    """Decides whether to retry after error and returns the delay, or raises."""
+    retryable, retry_after = classify_error(error)
+    if not retryable or attempt >= policy.max_retries:
+        raise error
+
+    delay = policy.next_delay(delay, retry_after)
+    if time.monotonic() - started + delay > policy.deadline:
+        print(f"Not retrying: waiting {delay:.2f}s would pass the {policy.deadline:g}s deadline")
+        raise error
+    if not policy.budget.try_spend():
+        raise RetryBudgetExceeded(f"Retry budget exhausted, giving up after: {error}") from error
+
+    print(f"Retryable error ({error}), retrying in {delay:.2f} seconds...")
+    return delay
+
+
+def retry_call(func, policy=None):
+    """Calls func(), retrying rate limits and transient provider errors.
+
+    Meant for worker threads: the wait is bounded by the policy deadline and the
+    shared retry budget, and other threads keep serving while this one sleeps.
+    """
+    policy = policy or default_policy
+    policy.budget.record_call()
+    started = time.monotonic()
+    delay = policy.base_delay
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            delay = _plan_retry(e, attempt, delay, started, policy)
+        time.sleep(delay)
+        attempt += 1
+
+
+async def retry_call_async(func, policy=None):
+    """Awaits func() with the same retry rules as retry_call, without blocking the event loop."""
+    policy = policy or default_policy
+    policy.budget.record_call()
+    started = time.monotonic()
+    delay = policy.base_delay
+    attempt = 0
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            delay = _plan_retry(e, attempt, delay, started, policy)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+default_policy = RetryPolicy()
@@ -0,0 +1,47 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+
+class SqliteStore:
+    """Base class of the stores kept in an SQLite file shared by every worker process on the machine.
+
+    Every operation opens a fresh connection, which keeps a store safe to use
+    from any thread and from forked workers. Connections are in autocommit
+    mode, so a lone statement commits by itself, and statements that must
+    apply together go in a _transaction().
+    """
+
+    row_factory = None
+
+    def __init__(self, path, schema=()):
+        """Creates the file and runs the schema's CREATE ... IF NOT EXISTS statements."""
+        self.path = path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in schema:
+                conn.execute(statement)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = self.row_factory
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """A connection that holds the write lock for the whole block and commits unless it raises."""
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock, so a read-modify-write is atomic across processes
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
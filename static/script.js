@@ -33,4 +33,159 @@ document.addEventListener("DOMContentLoaded", function () {
             });
         });
     }
-});
\ No newline at end of file
+});
+
+// Scan form: list the pages for reordering, shrink them in the browser, and skip uploading
+// the ones the server has already read
+document.addEventListener("DOMContentLoaded", function () {
+    const scanForm = document.getElementById("scan-form");
+    if (!scanForm) {
+        return;
+    }
+    const imageInput = scanForm.querySelector('input[name="image"]');
+    const pageOrderInput = scanForm.querySelector('input[name="page_order"]');
+    const pageList = document.getElementById("file-name");
+    // The server sends the size it would shrink the images to anyway, so nothing it needs is thrown away here
+    const maxSide = parseInt(scanForm.dataset.maxSide, 10) || 2048;
+    const quality = parseFloat(scanForm.dataset.quality) || 0.8;
+    let pages = []; // The chosen files, in the teacher's page order
+    let prepared = false;
+
+    function renderPages() {
+        pageList.textContent = "";
+        pages.forEach((page, index) => {
+            const row = document.createElement("div");
+            row.textContent = `Page ${index + 1}: ${page.name} `;
+            [["↑", index - 1], ["↓", index + 1]].forEach(([label, target]) => {
+                const button = document.createElement("button");
+                button.type = "button";
+                button.textContent = label;
+                button.style.padding = "0 8px";
+                button.disabled = target < 0 || target >= pages.length;
+                button.addEventListener("click", () => {
+                    [pages[index], pages[target]] = [pages[target], pages[index]];
+                    renderPages();
+                });
+                row.appendChild(button);
+            });
+            pageList.appendChild(row);
+        });
+    }
+
+    imageInput.addEventListener("change", function () {
+        // Pages start out sorted by file name, which is usually the order the photos were taken in
+        pages = Array.from(imageInput.files).sort((a, b) => a.name.localeCompare(b.name, undefined, { numeric: true }));
+        renderPages();
+    });
+
+    function loadImage(file) {
+        // createImageBitmap turns phone photos upright from their EXIF orientation; <img> is the fallback
+        if (window.createImageBitmap) {
+            return createImageBitmap(file, { imageOrientation: "from-image" });
+        }
+        return new Promise((resolve, reject) => {
+            const url = URL.createObjectURL(file);
+            const image = new Image();
+            image.onload = () => { URL.revokeObjectURL(url); resolve(image); };
+            image.onerror = () => { URL.revokeObjectURL(url); reject(new Error("The image could not be decoded.")); };
+            image.src = url;
+        });
+    }
+
+    function canvasToBlob(canvas, type) {
+        return new Promise(resolve => canvas.toBlob(resolve, type, quality));
+    }
+
+    async function compressImage(file) {
+        // Returns a smaller WebP or JPEG copy of the image, or the file itself when that isn't possible
+        const canvas = document.createElement("canvas");
+        if (!canvas.getContext || !canvas.toBlob) {
+            return file;
+        }
+        const image = await loadImage(file);
+        const scale = Math.min(1, maxSide / Math.max(image.width, image.height));
+        canvas.width = Math.round(image.width * scale);
+        canvas.height = Math.round(image.height * scale);
+        canvas.getContext("2d").drawImage(image, 0, 0, canvas.width, canvas.height);
+
+        // Browsers that can't encode WebP hand back a PNG instead, so JPEG is used there
+        let blob = await canvasToBlob(canvas, "image/webp");
+        if (!blob || blob.type !== "image/webp") {
+            blob = await canvasToBlob(canvas, "image/jpeg");
+        }
+        if (!blob || blob.size >= file.size) {
+            return file;
+        }
+        const extension = blob.type === "image/webp" ? ".webp" : ".jpg";
+        return new File([blob], file.name.replace(/\.[^.]*$/, "") + extension, { type: blob.type });
+    }
+
+    async function sha256Hex(blob) {
+        const digest = await crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, "0")).join("");
+    }
+
+    async function cachedHash(file) {
+        // Returns the file's SHA-256 if the server already has its text, otherwise null.
+        // crypto.subtle only exists on HTTPS and localhost; elsewhere every page is simply uploaded
+        if (!window.crypto || !crypto.subtle) {
+            return null;
+        }
+        try {
+            const imageHash = await sha256Hex(file);
+            const response = await fetch("/ocr_cache/" + imageHash);
+            return response.ok && (await response.json()).cached ? imageHash : null;
+        } catch (error) {
+            console.error("Image hash check failed, uploading the image instead:", error);
+            return null;
+        }
+    }
+
+    scanForm.addEventListener("submit", async function (event) {
+        if (prepared || !pages.length) {
+            return;
+        }
+        event.preventDefault();
+        prepared = true;
+
+        // Without a DataTransfer the input's files can't be swapped, so the originals are sent as chosen
+        const chosen = Array.from(imageInput.files);
+        let order = pages.map(page => String(chosen.indexOf(page)));
+        if (window.DataTransfer) {
+            try {
+                // All pages are compressed and checked at the same time
+                const compressed = await Promise.all(pages.map(page => compressImage(page).catch(error => {
+                    console.error("Image compression failed, uploading the original instead:", error);
+                    return page;
+                })));
+                // The hashes are of the bytes that would be uploaded, which is what the server keys its cache on
+                const hashes = await Promise.all(compressed.map(cachedHash));
+
+                const transfer = new DataTransfer();
+                order = compressed.map((file, index) => {
+                    if (hashes[index]) {
+                        return hashes[index];
+                    }
+                    transfer.items.add(file);
+                    return String(transfer.items.length - 1);
+                });
+                imageInput.files = transfer.files;
+            } catch (error) {
+                console.error("Preparing the pages failed, uploading them as chosen:", error);
+            }
+        }
+        pageOrderInput.value = order.join(",");
+        scanForm.requestSubmit ? scanForm.requestSubmit() : scanForm.submit();
+    });
+
+    // Coming back with the browser's back button puts the chosen pages back in the input
+    window.addEventListener("pageshow", function () {
+        prepared = false;
+        pageOrderInput.value = "";
+        if (window.DataTransfer && pages.length) {
+            const transfer = new DataTransfer();
+            pages.forEach(page => transfer.items.add(page));
+            imageInput.files = transfer.files;
+        }
+    });
+});
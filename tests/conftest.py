@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# engine.py opens its caches at import time, so they go to a throwaway directory
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="checkmate-tests-"))
@@ -0,0 +1,119 @@
+import json
+
+import pytest
+
+import engine
+from engine import check_grade_reply, parse_rubric_response
+from parse_stats import ParseStats
+from response_cache import ResponseCache
+
+CRITERIA = [
+    {'name': "Thesis", 'points_possible': 10.0},
+    {'name': "Evidence", 'points_possible': 5.0},
+]
+
+
+def reply(*entries):
+    return json.dumps({'criteria': list(entries)})
+
+
+def test_parses_every_criterion():
+    raw = reply(
+        {'index': 1, 'grade': 8, 'justification': " Clear thesis. "},
+        {'index': 2, 'grade': 4.5, 'justification': "Good sources."},
+    )
+    assert parse_rubric_response(raw, CRITERIA) == [(8.0, "Clear thesis."), (4.5, "Good sources.")]
+
+
+def test_finds_json_inside_prose_and_code_fences():
+    raw = "Here are the grades:\n```json\n" + reply({'index': 2, 'grade': 3, 'justification': "Some."}) + "\n```"
+    assert parse_rubric_response(raw, CRITERIA) == [None, (3.0, "Some.")]
+
+
+def test_unparseable_reply_grades_nothing():
+    for raw in ("", "Grade: 8/10", "{'criteria': [}", "[1, 2]", '{"criteria": {"index": 1}}', '{"grades": []}'):
+        assert parse_rubric_response(raw, CRITERIA) == [None, None], raw
+
+
+def test_malformed_entries_are_skipped():
+    raw = reply(
+        "not an entry",
+        {'index': 0, 'grade': 5, 'justification': "Out of range index."},
+        {'index': 3, 'grade': 5, 'justification': "Out of range index."},
+        {'index': True, 'grade': 5, 'justification': "Boolean index."},
+        {'index': "1", 'grade': 5, 'justification': "String index."},
+        {'index': 1, 'grade': 11, 'justification': "More than the points possible."},
+        {'index': 1, 'grade': -1, 'justification': "Negative grade."},
+        {'index': 1, 'grade': "8", 'justification': "String grade."},
+        {'index': 1, 'grade': False, 'justification': "Boolean grade."},
+        {'index': 1, 'grade': 8, 'justification': "   "},
+        {'index': 1, 'grade': 8},
+        {'index': 2, 'grade': 5, 'justification': "Full marks."},
+    )
+    assert parse_rubric_response(raw, CRITERIA) == [None, (5.0, "Full marks.")]
+
+
+def test_check_grade_reply_accepts_a_well_formed_reply():
+    reply_text = "Grade: 7.5/10\nJustification: Clear thesis, thin evidence."
+    assert check_grade_reply(reply_text, 10.0) == (7.5, "Clear thesis, thin evidence.", None)
+
+
+def test_check_grade_reply_names_the_problem():
+    missing_grade = check_grade_reply("I would give this a 7.\nJustification: Good.", 10.0)
+    out_of_range = check_grade_reply("Grade: 12/10\nJustification: Excellent.", 10.0)
+    empty_justification = check_grade_reply("Grade: 7/10\nJustification:   ", 10.0)
+    no_justification = check_grade_reply("Grade: 7/10", 10.0)
+
+    assert missing_grade == (None, None, "it has no line of the form 'Grade: [numeric value]/10'")
+    assert out_of_range == (None, None, "the grade 12 is not between 0 and 10")
+    assert empty_justification[2] == no_justification[2] == "it has no 'Justification:' with a justification after it"
+
+
+@pytest.fixture
+def canned_replies(tmp_path, monkeypatch):
+    """Replaces complete_text with canned replies and gives the test its own caches and parse stats."""
+    replies = []
+    prompts = []
+
+    def complete_text(messages, on_partial=None, with_model=False):
+        prompts.append(messages)
+        text = replies.pop(0)
+        return (text, "fake-model") if with_model else text
+
+    monkeypatch.setattr(engine, 'complete_text', complete_text)
+    monkeypatch.setattr(engine, 'response_cache', ResponseCache(str(tmp_path / "responses.sqlite3")))
+    monkeypatch.setattr(engine, 'parse_stats', ParseStats(str(tmp_path / "parse_stats.sqlite3")))
+    monkeypatch.setattr(engine, 'print', lambda *args, **kwargs: None, raising=False)
+    return replies, prompts
+
+
+def test_unusable_grade_is_corrected_with_one_follow_up(canned_replies):
+    replies, prompts = canned_replies
+    replies.extend(["Grade: 15/10\nJustification: Great.", "Grade: 9/10\nJustification: Great."])
+
+    assert engine.grade_criterion("An essay.", "Context", CRITERIA[0]) == (9.0, "Great.")
+    assert len(prompts) == 2
+    assert prompts[1][-1]['role'] == 'user'
+    assert "the grade 15 is not between 0 and 10" in prompts[1][-1]['content']
+    counts = engine.parse_stats.stats()['fake-model']['grade']
+    assert (counts['valid'], counts['corrected'], counts['failed']) == (0, 1, 0)
+
+
+def test_grade_still_unusable_after_the_follow_up_fails(canned_replies):
+    replies, prompts = canned_replies
+    replies.extend(["Grade: 9/10", "Still no justification: Grade: 9/10"])
+
+    with pytest.raises(ValueError, match="could not be used"):
+        engine.grade_criterion("An essay.", "Context", CRITERIA[0])
+    assert len(prompts) == 2
+    counts = engine.parse_stats.stats()['fake-model']['grade']
+    assert (counts['valid'], counts['corrected'], counts['failed']) == (0, 0, 1)
+
+
+def test_valid_grade_is_counted_without_a_follow_up(canned_replies):
+    replies, prompts = canned_replies
+    replies.append("Grade: 4/5\nJustification: Good sources.")
+
+    assert engine.grade_criterion("An essay.", "Context", CRITERIA[1]) == (4.0, "Good sources.")
+    assert len(prompts) == 1
+    assert engine.parse_stats.stats()['fake-model']['grade']['valid'] == 1
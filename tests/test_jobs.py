@@ -0,0 +1,97 @@
+import time
+
+from jobs import JobQueue
+
+
+def make_queue(tmp_path, **options):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), **options)
+
+
+def test_leased_job_is_not_claimed_twice(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue('grade', {'essay': 1})
+
+    job = queue.claim()
+    assert job == {'id': job_id, 'kind': 'grade', 'payload': {'essay': 1}, 'attempts': 1}
+    assert queue.claim() is None
+    assert queue.get(job_id)['status'] == 'running'
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0.05)
+    job_id = queue.enqueue('grade', {})
+
+    first = queue.claim()
+    time.sleep(0.1)
+    second = queue.claim()
+    assert second['id'] == job_id
+    assert second['attempts'] == 2
+
+    # The worker that lost its lease can no longer finish the job
+    assert not queue.renew(job_id, first['attempts'])
+    assert not queue.complete(job_id, {'grade': 1}, first['attempts'])
+    assert not queue.fail(job_id, "stale", first['attempts'])
+    assert queue.complete(job_id, {'grade': 2}, second['attempts'])
+
+    job = queue.get(job_id)
+    assert job['status'] == 'done'
+    assert job['result'] == {'grade': 2}
+
+
+def test_renew_extends_the_lease(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0.2)
+    job_id = queue.enqueue('grade', {})
+
+    job = queue.claim()
+    time.sleep(0.15)
+    assert queue.renew(job_id, job['attempts'])
+    time.sleep(0.1)
+    assert queue.claim() is None
+
+
+def test_job_fails_once_its_last_lease_expires(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0.05, max_attempts=2)
+    job_id = queue.enqueue('grade', {})
+
+    for _ in range(2):
+        assert queue.claim()['id'] == job_id
+        time.sleep(0.1)
+    assert queue.claim() is None
+
+    job = queue.get(job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Worker stopped while running the job'
+
+
+def test_fail_requeues_until_attempts_run_out(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=2)
+    job_id = queue.enqueue('grade', {})
+
+    assert queue.fail(job_id, "provider down", queue.claim()['attempts'])
+    assert queue.get(job_id)['status'] == 'queued'
+    assert queue.fail(job_id, "provider down", queue.claim()['attempts'])
+    assert queue.get(job_id)['status'] == 'failed'
+    assert queue.claim() is None
+
+    assert queue.retry(job_id)
+    assert queue.claim()['attempts'] == 1
+
+
+def test_events_are_dropped_when_the_job_finishes(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue('grade', {})
+    job = queue.claim()
+
+    queue.add_event(job_id, 'summary', {'text': "a"}, job['attempts'])
+    queue.add_event(job_id, 'criterion', {'index': 0}, job['attempts'])
+    first_seq = queue.events_since(job_id)[0][0]
+    assert queue.events_since(job_id, first_seq) == [(first_seq + 1, 'criterion', {'index': 0})]
+
+    queue.complete(job_id, {}, job['attempts'])
+    assert queue.events_since(job_id) == []
+
+    # A stage that outlived the attempt can no longer leave events behind
+    assert not queue.add_event(job_id, 'criterion', {'index': 1}, job['attempts'])
+    queue.set_progress(job_id, {'done': 1}, job['attempts'])
+    assert queue.events_since(job_id) == []
+    assert queue.get(job_id)['progress'] is None
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+from g4f.errors import RateLimitError
+
+import key_pool
+from key_pool import KeyPool
+from rate_limit import RateLimitTimeout
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(key_pool, 'print', lambda *args, **kwargs: None, raising=False)
+    return KeyPool(["key-a", "key-b"], client_factory=lambda api_key: api_key, cooldown=60)
+
+
+def fail_with(error):
+    def func(key):
+        raise error
+    return func
+
+
+def test_calls_go_to_the_least_loaded_key(pool):
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.api_key, second.api_key} == {"key-a", "key-b"}
+    pool.release(first, latency=0.1)
+    assert pool.acquire() is first
+
+
+def test_rate_limited_key_cools_down_for_retry_after(pool):
+    with pytest.raises(RateLimitError):
+        pool.call(fail_with(RateLimitError("Quota exceeded, retry after 5s")))
+    limited = next(key for key in pool.keys if key.rate_limited)
+    assert limited.cooldown_until - time.time() == pytest.approx(5, abs=0.5)
+
+    # Every call now goes to the other key, even though it is busier
+    for _ in range(3):
+        assert pool.call(lambda key: key.api_key) != limited.api_key
+
+
+def test_rate_limited_key_without_a_hint_uses_the_default_cooldown(pool):
+    with pytest.raises(RateLimitError):
+        pool.call(fail_with(RateLimitError("Quota exceeded")))
+    limited = next(key for key in pool.keys if key.rate_limited)
+    assert limited.cooldown_until - time.time() == pytest.approx(60, abs=0.5)
+
+
+def test_other_errors_do_not_cool_a_key_down(pool):
+    with pytest.raises(ValueError):
+        pool.call(fail_with(ValueError("bad reply")))
+    assert sum(key.errors for key in pool.keys) == 1
+    assert all(key.is_healthy(time.time()) for key in pool.keys)
+
+
+def test_when_every_key_cools_down_the_first_back_is_used(pool):
+    now = time.time()
+    pool.keys[0].cooldown_until = now + 30
+    pool.keys[1].cooldown_until = now + 10
+    assert pool.acquire() is pool.keys[1]
+
+
+def test_local_rate_limit_timeout_is_not_counted_against_the_key(pool):
+    def no_slot(key):
+        raise RateLimitTimeout("no slot")
+
+    with pytest.raises(RateLimitTimeout):
+        pool.call(lambda key: "sent", before=no_slot)
+    stats = pool.stats().values()
+    assert all(key['requests'] == 0 and key['in_flight'] == 0 and key['errors'] == 0 for key in stats)
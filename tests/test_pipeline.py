@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+
+def test_results_keep_input_order():
+    # Later items finish first, so they leave the pipeline out of order
+    def slow_start(index, item):
+        time.sleep(0.01 * (5 - index))
+        return item * 2
+
+    finished = []
+    pipeline = Pipeline([
+        Stage('double', slow_start, workers=5),
+        Stage('add', lambda index, item: item + 1, workers=2),
+    ], queue_size=1)
+    results = pipeline.run(range(5), on_result=lambda index, result: finished.append(index))
+
+    assert results == [1, 3, 5, 7, 9]
+    assert sorted(finished) == [0, 1, 2, 3, 4]
+    assert finished != [0, 1, 2, 3, 4]
+
+
+def test_failed_item_skips_later_stages():
+    def read(index, item):
+        if item == 'bad':
+            raise ValueError("unreadable")
+        return item.upper()
+
+    graded = []
+
+    def grade(index, item):
+        graded.append(item)
+        return f"graded {item}"
+
+    pipeline = Pipeline(
+        [Stage('read', read), Stage('grade', grade)],
+        on_error=lambda index, item, stage_name, error: f"{stage_name} failed on {item}: {error}"
+    )
+    results = pipeline.run(['a', 'bad', 'c'])
+
+    assert results == ['graded A', 'read failed on bad: unreadable', 'graded C']
+    assert graded == ['A', 'C']
+    stats = pipeline.stats()
+    assert (stats['read']['processed'], stats['read']['failed']) == (3, 1)
+    assert stats['grade']['processed'] == 2
+
+
+def test_error_is_the_result_without_on_error():
+    def fail(index, item):
+        raise RuntimeError("boom")
+
+    results = Pipeline([Stage('fail', fail)]).run([1])
+    assert isinstance(results[0], RuntimeError)
+
+
+def test_pipeline_needs_a_stage():
+    with pytest.raises(ValueError):
+        Pipeline([])
+
+
+def test_failing_callbacks_do_not_stall_the_pipeline():
+    def read(index, item):
+        if item == 'bad':
+            raise ValueError("unreadable")
+        return item
+
+    def on_error(index, item, stage_name, error):
+        raise RuntimeError("error handler failed")
+
+    def on_result(index, result):
+        if result == 'b':
+            raise OSError("disk full")
+
+    pipeline = Pipeline([Stage('read', read), Stage('grade', lambda index, item: item)], queue_size=1,
+                        on_error=on_error)
+    results = pipeline.run(['a', 'b', 'bad', 'c', 'd'], on_result=on_result)
+
+    assert results[0] == 'a'
+    assert isinstance(results[1], OSError)
+    assert isinstance(results[2], RuntimeError)
+    assert results[3:] == ['c', 'd']
@@ -0,0 +1,59 @@
+from provider_router import CircuitBreaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.on_failure(now=0)
+    breaker.on_failure(now=1)
+    assert breaker.state == 'closed'
+    assert breaker.allows(now=1)
+
+    breaker.on_failure(now=2)
+    assert breaker.state == 'open'
+    assert not breaker.allows(now=31)
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.on_failure(now=0)
+    breaker.on_success()
+    breaker.on_failure(now=1)
+    assert breaker.state == 'closed'
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.on_failure(now=0)
+
+    assert breaker.allows(now=30)
+    assert breaker.state == 'half_open'
+    breaker.on_start()
+    assert not breaker.allows(now=31)
+
+    breaker.on_success()
+    assert breaker.state == 'closed'
+    assert breaker.allows(now=31)
+
+
+def test_failed_trial_opens_again():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for now in range(5):
+        breaker.on_failure(now=now)
+
+    assert breaker.allows(now=40)
+    breaker.on_start()
+    breaker.on_failure(now=41)
+    assert breaker.state == 'open'
+    assert not breaker.allows(now=70)
+    assert breaker.allows(now=71)
+
+
+def test_cancelled_trial_frees_the_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.on_failure(now=0)
+    assert breaker.allows(now=30)
+    breaker.on_start()
+
+    breaker.on_cancel()
+    assert breaker.state == 'half_open'
+    assert breaker.allows(now=31)
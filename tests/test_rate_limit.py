@@ -0,0 +1,60 @@
+import pytest
+
+import rate_limit
+from rate_limit import RateLimitTimeout, SharedRateLimiter, key_fingerprint
+
+
+@pytest.fixture
+def limiter(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limit, 'print', lambda *args, **kwargs: None, raising=False)
+    return SharedRateLimiter(str(tmp_path / "rate_limits.sqlite3"), max_wait=1.5)
+
+
+def test_full_bucket_serves_its_capacity_then_queues_callers(limiter):
+    waits = [limiter._reserve("m:key", rate=1.0, capacity=2) for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    # Each caller past the burst waits one more refill interval than the one before it
+    assert waits[2] == pytest.approx(1.0, abs=0.05)
+    assert waits[3] == pytest.approx(2.0, abs=0.05)
+
+
+def test_caller_over_max_wait_takes_no_token(limiter):
+    for _ in range(3):
+        limiter._reserve("m:key", rate=1.0, capacity=1)
+    assert limiter._reserve("m:key", rate=1.0, capacity=1) > limiter.max_wait
+    # The refused caller left no debt behind, so the next one waits just as long
+    assert limiter._reserve("m:key", rate=1.0, capacity=1) == pytest.approx(2.0, abs=0.05)
+
+
+def test_acquire_times_out_instead_of_waiting_past_max_wait(limiter):
+    limiter.limits = {'m': {'rate': 0.5, 'capacity': 1}}
+    limiter.acquire('m', "key")
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire('m', "key")
+
+
+def test_limits_are_looked_up_per_key_then_per_model_then_default(limiter):
+    fingerprint = key_fingerprint("key")
+    limiter.limits = {
+        f"m:{fingerprint}": {'rate': 1, 'capacity': 1},
+        'm': {'rate': 2, 'capacity': 2},
+        'default': {'rate': 3, 'capacity': 3},
+    }
+    assert limiter._limit_for('m', fingerprint)['rate'] == 1
+    assert limiter._limit_for('m', key_fingerprint("other"))['rate'] == 2
+    assert limiter._limit_for('other-model', fingerprint)['rate'] == 3
+
+
+def test_models_without_a_limit_are_not_limited(limiter):
+    limiter.limits = {'m': {'rate': 0.01, 'capacity': 1}}
+    for _ in range(5):
+        limiter.acquire('other-model', "key")
+    assert limiter.stats() == {}
+
+
+def test_buckets_are_per_model_and_key(limiter):
+    limiter.limits = {'default': {'rate': 0.01, 'capacity': 1}}
+    limiter.acquire('m', "key")
+    limiter.acquire('m', "other key")
+    limiter.acquire('other-model', "key")
+    assert sorted(limiter.stats().values()) == [0.0, 0.0, 0.0]
@@ -0,0 +1,125 @@
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import ClientResponseError
+from g4f.errors import RateLimitError, ResponseStatusError
+
+import retry
+from retry import RetryBudget, RetryBudgetExceeded, RetryPolicy, classify_error, parse_retry_after, retry_call
+
+
+def response_error(status, headers=None):
+    request_info = SimpleNamespace(real_url="https://provider.example/v1/chat")
+    return ClientResponseError(request_info, (), status=status, message="error", headers=headers)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after(" 1.5 ") == 1.5
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 8 <= parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after(formatdate(time.time() - 10, usegmt=True)) == 0.0
+
+
+def test_classify_rate_limits_and_server_errors_as_retryable():
+    assert classify_error(RateLimitError("Quota exceeded, retry after 2.5s")) == (True, 2.5)
+    assert classify_error(RateLimitError("Please retry in 500ms")) == (True, 0.5)
+    assert classify_error(RateLimitError("Quota exceeded")) == (True, None)
+    assert classify_error(response_error(503, {'Retry-After': "7"})) == (True, 7.0)
+    assert classify_error(response_error(429)) == (True, None)
+    assert classify_error(ResponseStatusError("Response 502: Bad Gateway")) == (True, None)
+    assert classify_error(ConnectionError("reset by peer")) == (True, None)
+    assert classify_error(TimeoutError()) == (True, None)
+
+
+def test_classify_client_errors_as_final():
+    assert classify_error(response_error(400))[0] is False
+    assert classify_error(response_error(401))[0] is False
+    assert classify_error(ResponseStatusError("Response 400: invalid model")) == (False, None)
+    assert classify_error(ValueError("No grade was returned")) == (False, None)
+
+
+def test_budget_allows_min_retries_plus_a_share_of_calls():
+    budget = RetryBudget(ratio=0.5, min_retries=1, window=60)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+    for _ in range(4):
+        budget.record_call()
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    assert budget.stats() == {'calls': 4, 'retries': 3}
+
+
+def test_budget_forgets_retries_outside_the_window():
+    budget = RetryBudget(ratio=0, min_retries=1, window=0.05)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    time.sleep(0.1)
+    assert budget.try_spend()
+
+
+@pytest.fixture
+def quiet_retries(monkeypatch):
+    monkeypatch.setattr(retry, 'print', lambda *args, **kwargs: None, raising=False)
+
+
+def failing(errors, result="ok"):
+    """A call that raises each of errors in turn, then returns result."""
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return func, calls
+
+
+def test_retry_call_retries_transient_errors(quiet_retries):
+    policy = RetryPolicy(max_retries=3, base_delay=0.001, max_delay=0.01)
+    func, calls = failing([ConnectionError("reset"), RateLimitError("busy")])
+    assert retry_call(func, policy) == "ok"
+    assert len(calls) == 3
+
+
+def test_retry_call_gives_up_on_final_errors_and_after_max_retries(quiet_retries):
+    policy = RetryPolicy(max_retries=2, base_delay=0.001, max_delay=0.01)
+    func, calls = failing([ValueError("bad prompt")])
+    with pytest.raises(ValueError):
+        retry_call(func, policy)
+    assert len(calls) == 1
+
+    func, calls = failing([ConnectionError("reset")] * 5)
+    with pytest.raises(ConnectionError):
+        retry_call(func, policy)
+    assert len(calls) == 3
+
+
+def test_retry_call_stops_when_the_budget_is_spent(quiet_retries):
+    policy = RetryPolicy(max_retries=5, base_delay=0.001, max_delay=0.01,
+                         budget=RetryBudget(ratio=0, min_retries=2, window=60))
+    func, calls = failing([ConnectionError("reset")] * 5)
+    with pytest.raises(RetryBudgetExceeded):
+        retry_call(func, policy)
+    assert len(calls) == 3
+
+
+def test_retry_call_respects_the_deadline(quiet_retries):
+    policy = RetryPolicy(max_retries=3, base_delay=0.001, max_delay=0.01, deadline=1)
+    func, calls = failing([RateLimitError("retry after 5s")])
+    with pytest.raises(RateLimitError):
+        retry_call(func, policy)
+    assert len(calls) == 1
+
+
+def test_next_delay_stays_within_bounds_and_honours_retry_after():
+    policy = RetryPolicy(base_delay=1, max_delay=30)
+    delays = [policy.next_delay(20) for _ in range(200)]
+    assert all(1 <= delay <= 30 for delay in delays)
+    assert policy.next_delay(1, retry_after=45) == 45
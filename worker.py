@@ -0,0 +1,24 @@
+import os
+import signal
+import threading
+
+from app import job_queue, JOB_HANDLERS
+from jobs import start_workers
+
+if __name__ == "__main__":
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    worker_count = int(os.environ.get("JOB_WORKERS", 4))
+    threads = start_workers(job_queue, JOB_HANDLERS, worker_count, stop_event)
+    print(f"Started {worker_count} job workers")
+
+    try:
+        while not stop_event.is_set():
+            stop_event.wait(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+    # Running jobs finish their current attempt; unfinished ones are picked up again after a restart
+    for thread in threads:
+        thread.join()